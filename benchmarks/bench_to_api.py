@@ -0,0 +1,67 @@
+"""Compares compiled `to_api` serializer with the per-row column scan
+it replaced, on a wide model.
+
+    python -m benchmarks.bench_to_api --columns 60 --rows 100
+"""
+import argparse
+import timeit
+from datetime import datetime
+
+from flask import g
+
+from flask_vanilla import FlaskVanilla, db, UserMode
+from flask_vanilla.model import BaseModel
+
+
+def make_wide_model(columns):
+    attrs = {f'col{i}': db.Column(db.String) for i in range(columns)}
+    attrs['stamp'] = db.Column(db.DateTime)
+    return type('WideModel', (BaseModel, db.Model), attrs)
+
+
+def to_api_column_scan(obj):
+    """Former BaseModel.to_api implementation, without includes"""
+    obj.id
+    public_cols = [col.name for col in obj.__table__.columns
+                   if not col.is_private]
+    data = {k: v for k, v in obj.__dict__.items()
+            if k != '_sa_instance_state'}
+    return {k: v for k, v in data.items() if k in public_cols}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--columns', type=int, default=60)
+    parser.add_argument('--rows', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    app = FlaskVanilla(__name__, user_action_tracking=False,
+                       user_mode=UserMode.SIMPLE)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    model = make_wide_model(args.columns)
+
+    with app.test_request_context():
+        g.user = None
+        db.create_all()
+        objs = [model(stamp=datetime.now(),
+                      **{f'col{i}': str(i) for i in range(args.columns)})
+                for _ in range(args.rows)]
+        db.session.add_all(objs)
+        db.session.commit()
+        objs = model.query.all()
+
+        old = timeit.timeit(lambda: [to_api_column_scan(o) for o in objs],
+                            number=args.repeat)
+        new = timeit.timeit(lambda: [o.to_api() for o in objs],
+                            number=args.repeat)
+
+    print(f'{args.rows} rows x {args.columns} columns, '
+          f'{args.repeat} repeats')
+    print(f'column scan: {old * 1000 / args.repeat:.3f} ms per list')
+    print(f'compiled:    {new * 1000 / args.repeat:.3f} ms per list')
+    print(f'speedup:     {old / new:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""Micro-benchmarks of CRUD hot paths on the models of examples/example1.py.
+
+    python -m benchmarks.crud --rows 1000 --output results.json
+    python -m benchmarks.crud --baseline results.json --threshold 0.2
+
+Every stage is repeated and the median time is reported. With --baseline
+the run fails (exit code 1) if a stage is slower than the baseline by more
+than the threshold. Runs on a temporary SQLite database unless --database
+(an empty database) is given.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import sqlalchemy
+from flask import g
+
+
+def load_example(database):
+    """examples/example1.py on the benchmark database"""
+    os.environ['EXAMPLE_DATABASE_URI'] = database
+    from examples import example1
+    return example1
+
+
+def timed(f, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    return {'median_ms': statistics.median(times) * 1000,
+            'min_ms': min(times) * 1000}
+
+
+def checked(request, status=200):
+    """`request` of the test client, a response with another status fails
+    the run instead of being timed as a fast success"""
+    def f():
+        response = request()
+        if response.status_code != status:
+            raise RuntimeError(
+                f'{response.request.method} {response.request.path}: '
+                f'{response.status_code}, expected {status}')
+    return f
+
+
+def set_user(ex):
+    g.user = ex.app.User(id=1, name='Test',
+                         roles=[ex.DefaultRoles.SUPER_ADMIN,
+                                ex.DefaultRoles.TENANT_ADMIN])
+
+
+def seed(ex, rows):
+    db, Post = ex.db, ex.Post
+    posts = [Post(user_id=1, some_text=f'text {i}',
+                  json_columns={'i': i, 'values': list(range(10))})
+             for i in range(rows)]
+    db.session.add_all(posts)
+    db.session.flush()
+    db.session.add_all([ex.Comment(user_id=1, post_id=post.id,
+                                   text='comment')
+                        for post in posts for _ in range(2)])
+    db.session.add_all([ex.UniqueNameModel(user_id=1, name=f'name {i}')
+                        for i in range(rows)])
+    db.session.commit()
+
+
+def bench_stages(ex, rows, repeat):
+    db, Post, UniqueNameModel = ex.db, ex.Post, ex.UniqueNameModel
+    results = {}
+    with ex.app.test_request_context('/post/'):
+        set_user(ex)
+        seed(ex, rows)
+
+        def build_query():
+            return Post.query.with_access_check().filter(
+                Post.some_text.like('text%')).order_by(Post.id)
+
+        query = build_query()
+        statement = query.statement
+
+        results['query_build'] = timed(build_query, repeat)
+        results['sql'] = timed(
+            lambda: db.session.execute(statement).fetchall(), repeat)
+
+        def hydrate():
+            db.session.expunge_all()
+            return query.all()
+
+        total = timed(hydrate, repeat)
+        results['orm_hydration'] = {
+            k: max(v - results['sql'][k], 0) for k, v in total.items()}
+
+        objs = query.all()
+        results['serialization'] = timed(
+            lambda: [obj.to_api() for obj in objs], repeat)
+
+        def validate():
+            for i in range(min(rows, 100)):
+                obj = Post()
+                obj.populate_from_data({'some_text': f'new {i}',
+                                        'json_columns': [i]})
+                obj.validate_on_create()
+                obj = UniqueNameModel()
+                obj.populate_from_data({'name': f'new name {i}'})
+                obj.validate_on_create()
+            db.session.rollback()
+
+        results['validation_100'] = timed(validate, repeat)
+    return results
+
+
+def bench_endpoints(ex, repeat):
+    Post = ex.Post
+    results = {}
+    client = ex.app.test_client()
+    with ex.app.app_context():
+        post_id = Post.query.raw().order_by(Post.id).first().id
+
+    results['GET /post/'] = timed(
+        checked(lambda: client.get('/post/')), repeat)
+    results['GET /post/?page'] = timed(
+        checked(lambda: client.get('/post/?page=2&limit=50')), repeat)
+    results['GET /comment/?include'] = timed(
+        checked(lambda: client.get('/comment/?include=post')), repeat)
+    results['GET /post/<id>'] = timed(
+        checked(lambda: client.get(f'/post/{post_id}')), repeat)
+    results['POST /post'] = timed(
+        checked(lambda: client.post('/post', data=json.dumps(
+            {'some_text': 'created', 'json_columns': [1, 2]}),
+            content_type='application/json')), repeat)
+    results['PUT /post/<id>'] = timed(
+        checked(lambda: client.put(f'/post/{post_id}', data=json.dumps(
+            {'some_text': 'updated'}), content_type='application/json')),
+        repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, value in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base or not base['median_ms']:
+            continue
+        change = value['median_ms'] / base['median_ms'] - 1
+        if change > threshold:
+            regressions.append((name, base['median_ms'], value['median_ms'],
+                                change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='Write results to JSON file')
+    parser.add_argument('--baseline', help='Compare with results JSON file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Allowed slowdown, 0.2 is 20%%')
+    parser.add_argument('--database',
+                        help='Empty database URI, temporary SQLite file by '
+                             'default')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ex = load_example(args.database or f'sqlite:///{tmp}/crud.db')
+        ex.app.config['SQL_REPEATED_QUERY_LIMIT'] = None
+        results = bench_stages(ex, args.rows, args.repeat)
+        results.update(bench_endpoints(ex, args.repeat))
+        with ex.app.app_context():
+            ex.db.session.remove()
+            ex.db.engine.dispose()
+
+    report = {
+        'meta': {'rows': args.rows, 'repeat': args.repeat,
+                 'python': platform.python_version(),
+                 'sqlalchemy': sqlalchemy.__version__},
+        'results': results,
+    }
+    for name, value in results.items():
+        print(f'{name:<25} {value["median_ms"]:10.3f} ms '
+              f'(min {value["min_ms"]:.3f})')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, base, value, change in regressions:
+            print(f'REGRESSION {name}: {base:.3f} -> {value:.3f} ms '
+                  f'(+{change:.0%})')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
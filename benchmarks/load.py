@@ -0,0 +1,219 @@
+"""Concurrent load test of ModelAPI routes of examples/example1.py.
+
+    python -m benchmarks.load --clients 16 --duration 20
+    python -m benchmarks.load --server processes --processes 4 \\
+        --mix create=1,get=4,list=4,update=1,delete=1 --output load.json
+
+Run from the repository root with the requirements installed. The app is
+served by a local werkzeug server (threaded or forking) on a temporary
+SQLite database (or --database), clients are threads using urllib, so it
+runs offline. Reports throughput, error rate and p50/p95/p99 latency per
+route.
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import socket
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+from werkzeug.serving import make_server
+
+from benchmarks.crud import load_example
+
+OPERATIONS = ('create', 'get', 'list', 'update', 'delete')
+
+
+def parse_mix(value):
+    mix = {}
+    for entry in value.split(','):
+        name, weight = entry.split('=')
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f'Unknown operation: {name}')
+        mix[name] = float(weight)
+    return mix
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve(database, port, processes):
+    ex = load_example(database)
+    app = ex.app
+    app.config['SQL_REPEATED_QUERY_LIMIT'] = None
+    with app.app_context():
+        # connections opened before fork must not be shared with the parent
+        ex.db.engine.dispose()
+        app.replica_pool.dispose()
+    make_server('127.0.0.1', port, app, threaded=processes == 1,
+                processes=processes).serve_forever()
+
+
+def start_server(database, mode, processes):
+    port = free_port()
+    if mode == 'threads':
+        target = threading.Thread(target=serve, args=(database, port, 1),
+                                  daemon=True)
+    else:
+        target = multiprocessing.Process(
+            target=serve, args=(database, port, processes), daemon=True)
+    target.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return f'http://127.0.0.1:{port}', target
+
+
+class Client(threading.Thread):
+    def __init__(self, base_url, prefix, mix, deadline, ids, lock, stats):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.prefix = prefix
+        self.operations = list(mix)
+        self.weights = [mix[op] for op in self.operations]
+        self.deadline = deadline
+        self.ids = ids
+        self.lock = lock
+        self.stats = stats
+
+    def request(self, route, method, path, data=None):
+        body = json.dumps(data).encode() if data is not None else None
+        req = urllib.request.Request(
+            self.base_url + path, data=body, method=method,
+            headers={'Content-Type': 'application/json'})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=30) as resp:
+                payload = resp.read()
+                ok = resp.status < 400
+        except urllib.error.HTTPError as e:
+            payload, ok = b'', e.code == 404 and method != 'POST'
+        except (urllib.error.URLError, OSError):
+            payload, ok = b'', False
+        latency = time.perf_counter() - start
+        with self.lock:
+            self.stats[route]['latencies'].append(latency)
+            if not ok:
+                self.stats[route]['errors'] += 1
+        return payload if ok else None
+
+    def random_id(self):
+        with self.lock:
+            return random.choice(self.ids) if self.ids else None
+
+    def run(self):
+        p = self.prefix
+        while time.monotonic() < self.deadline:
+            op = random.choices(self.operations, self.weights)[0]
+            if op == 'create':
+                payload = self.request(f'POST /{p}', 'POST', f'/{p}', {
+                    'some_text': 'load', 'json_columns': [1, 2, 3]})
+                if payload:
+                    with self.lock:
+                        self.ids.append(json.loads(payload)['id'])
+                continue
+            if op == 'list':
+                self.request(f'GET /{p}/', 'GET', f'/{p}/?limit=20&page=1')
+                continue
+            obj_id = self.random_id()
+            if obj_id is None:
+                continue
+            if op == 'get':
+                self.request(f'GET /{p}/<id>', 'GET', f'/{p}/{obj_id}')
+            elif op == 'update':
+                self.request(f'PUT /{p}/<id>', 'PUT', f'/{p}/{obj_id}',
+                             {'some_text': 'load updated'})
+            elif op == 'delete':
+                with self.lock:
+                    if obj_id in self.ids:
+                        self.ids.remove(obj_id)
+                self.request(f'DELETE /{p}/<id>', 'DELETE', f'/{p}/{obj_id}')
+
+
+def percentile(values, p):
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def report(stats, elapsed):
+    result = {}
+    for route, data in sorted(stats.items()):
+        latencies = sorted(data['latencies'])
+        if not latencies:
+            continue
+        result[route] = {
+            'requests': len(latencies),
+            'throughput_rps': len(latencies) / elapsed,
+            'error_rate': data['errors'] / len(latencies),
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20,
+                        help='Seconds')
+    parser.add_argument('--server', choices=('threads', 'processes'),
+                        default='threads')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--mix', type=parse_mix,
+                        default=parse_mix('create=1,get=4,list=4,update=1,'
+                                          'delete=0.5'))
+    parser.add_argument('--prefix', default='post')
+    parser.add_argument('--output', help='Write results to JSON file')
+    parser.add_argument('--database',
+                        help='Database URI, temporary SQLite file by default')
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    database = args.database or f'sqlite:///{tmp.name}/load.db'
+    base_url, server = start_server(database, args.server, args.processes)
+    ids, lock = [], threading.Lock()
+    stats = defaultdict(lambda: {'latencies': [], 'errors': 0})
+    start = time.monotonic()
+    clients = [Client(base_url, args.prefix, args.mix,
+                      start + args.duration, ids, lock, stats)
+               for _ in range(args.clients)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.monotonic() - start
+
+    result = report(stats, elapsed)
+    total = sum(r['requests'] for r in result.values())
+    print(f'{args.clients} clients, {args.server} server, {elapsed:.1f}s, '
+          f'{total / elapsed:.1f} req/s')
+    print(f'{"route":<22}{"req/s":>9}{"errors":>9}{"p50":>10}{"p95":>10}'
+          f'{"p99":>10}')
+    for route, r in result.items():
+        print(f'{route:<22}{r["throughput_rps"]:9.1f}'
+              f'{r["error_rate"]:9.1%}{r["p50_ms"]:9.1f}ms'
+              f'{r["p95_ms"]:8.1f}ms{r["p99_ms"]:8.1f}ms')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': {**vars(args), 'elapsed': elapsed},
+                       'results': result}, f, indent=2)
+    if isinstance(server, multiprocessing.Process):
+        server.terminate()
+        server.join()
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# the example app creates its tables on import, keep them out of the repo
+_tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault('EXAMPLE_DATABASE_URI',
+                      f'sqlite:///{_tmp.name}/example.db')
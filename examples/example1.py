@@ -1,5 +1,7 @@
+import os
+
 from flask_vanilla import FlaskVanilla, db, BaseEntity, Json, ModelAPI, \
-    UniqueNameEntity, DefaultRoles, BaseCRUDTestCase
+    UniqueNameEntity, DefaultRoles
 from flask import g
 from sqlalchemy.ext.declarative import declared_attr
 
@@ -15,7 +17,8 @@ class UserExtension():
 
 class Post(BaseEntity, db.Model):
     some_text = db.Column(db.String)
-    json_columns = db.Column(Json)
+    # heavy col - not loaded by list endpoint unless requested in `fields`
+    json_columns = db.Column(Json, heavy=True)
 
 
 class Comment(BaseEntity, db.Model):
@@ -35,6 +38,9 @@ class UniqueNameModel(UniqueNameEntity, db.Model):
 
 
 app = FlaskVanilla(__name__, user_extension=UserExtension)
+# tests and benchmarks run on own database
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'EXAMPLE_DATABASE_URI', app.config['SQLALCHEMY_DATABASE_URI'])
 
 post_api = ModelAPI(Post, app=app)
 comment_api = ModelAPI(Comment, app=app)
@@ -0,0 +1,52 @@
+import json
+import unittest
+
+from flask_vanilla import db, BaseEntity, BaseCRUDTestCaseMixin
+from flask_vanilla.async_api import AsyncModelAPI
+from examples.example1 import app
+
+
+class Article(BaseEntity, db.Model):
+    title = db.Column(db.String(100))
+
+
+article_api = AsyncModelAPI(Article, app=app)
+
+
+class ArticleTestCase(unittest.TestCase, BaseCRUDTestCaseMixin):
+    model_api = article_api
+    app = app
+
+    def setUp(self):
+        with app.app_context():
+            db.create_all()
+
+    def get_create_obj_fixture(self):
+        return {'title': 'async'}
+
+    def get_update_obj_fixture(self):
+        return {'title': 'async 2'}
+
+    def test_async_engine(self):
+        with app.app_context():
+            url = app.async_db.engine.url
+        self.assertEqual('sqlite+aiosqlite', url.drivername)
+
+    def test_list_page_and_etag(self):
+        for i in range(3):
+            resp = self.client().post(f'/{self.prefix}',
+                                      data=json.dumps({'title': f'page {i}'}))
+            self.assertEqual(200, resp.status_code)
+
+        resp = self.client().get(f'/{self.prefix}/?page=1&limit=2')
+
+        self.assertEqual(200, resp.status_code)
+        result = json.loads(resp.data)
+        self.assertEqual(2, len(result['items']))
+        self.assertTrue(result['has_more'])
+        with app.app_context():
+            self.assertEqual(Article.query.count(), result['count'])
+        resp = self.client().get(
+            f'/{self.prefix}/?page=1&limit=2',
+            headers={'If-None-Match': resp.headers['ETag']})
+        self.assertEqual(304, resp.status_code)
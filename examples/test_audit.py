@@ -0,0 +1,86 @@
+import json
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from flask_vanilla.audit import TrackingMode, UserActionWriter
+from examples.example1 import app
+from examples.test_bulk import count_statements
+
+
+class AsyncAuditTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        self.writer = app.user_action_writer
+        self.config = {key: app.config[key] for key in (
+            'USER_ACTION_TRACKING_MODE', 'USER_ACTION_FLUSH_INTERVAL')}
+        app.config.update(USER_ACTION_TRACKING_MODE=TrackingMode.ASYNC,
+                          USER_ACTION_FLUSH_INTERVAL=0.05)
+
+    def tearDown(self):
+        self.writer.stop()
+        app.config.update(self.config)
+
+    def create_post(self, text):
+        resp = self.client.post('/post', data=json.dumps({'some_text': text}),
+                                content_type='application/json')
+        self.assertEqual(200, resp.status_code)
+
+    def messages(self):
+        with app.app_context():
+            return app.UserAction.query.filter_by(
+                entity='post', name='created').count()
+
+    def test_writer_restarts_after_stop(self):
+        count = self.messages()
+        self.create_post('audit 1')
+        self.writer.stop()
+        self.assertEqual(count + 1, self.messages())
+
+        self.create_post('audit 2')
+        self.assertTrue(self.writer.running)
+        self.writer.stop()
+        self.assertEqual(count + 2, self.messages())
+
+    def test_teardown_flushes_without_writer_thread(self):
+        count = self.messages()
+        self.writer._start()
+        self.writer.stop()
+        # actions are queued while the thread is not running
+        with mock.patch.object(self.writer, '_start'):
+            self.create_post('audit 3')
+        self.assertFalse(self.writer.running)
+        self.assertEqual(count + 1, self.messages())
+
+    def test_session_listeners_added_once(self):
+        # e.g. a writer of another app instance, its listeners would take
+        # actions recorded by the writer of this app
+        with mock.patch('flask_vanilla.audit.event.listen') as listen:
+            UserActionWriter(Flask(__name__), app.UserAction)
+        listen.assert_not_called()
+
+        count = self.messages()
+        self.create_post('audit 4')
+        self.writer.stop()
+        self.assertEqual(count + 1, self.messages())
+
+
+class TransactionAuditTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        self.batch_size = app.config['USER_ACTION_BATCH_SIZE']
+        app.config['USER_ACTION_BATCH_SIZE'] = 2
+
+    def tearDown(self):
+        app.config['USER_ACTION_BATCH_SIZE'] = self.batch_size
+
+    def test_record_many_in_batches(self):
+        with count_statements() as statements:
+            resp = self.client.post(
+                '/post/bulk', data=json.dumps([{'some_text': 'audit'}] * 5),
+                content_type='application/json')
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(3, sum(s.startswith('INSERT INTO user_action')
+                                for s in statements))
@@ -0,0 +1,189 @@
+import json
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+
+from flask import abort
+from sqlalchemy import event
+
+from flask_vanilla import Permission
+from examples.example1 import app, db, post_api, Post
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+class BulkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        self.chunk_size = post_api.bulk_chunk_size
+        post_api.bulk_chunk_size = 2
+
+    def tearDown(self):
+        post_api.bulk_chunk_size = self.chunk_size
+
+    def create_posts(self, count):
+        resp = self.client.post(
+            '/post/bulk',
+            data=json.dumps([{'some_text': f'bulk {i}'}
+                             for i in range(count)]),
+            content_type='application/json')
+        self.assertEqual(200, resp.status_code)
+        return [r['result']['id'] for r in json.loads(resp.data)]
+
+    def delete_all(self, ids, soft=None):
+        """`soft` - value of the soft param"""
+        actions = []
+
+        def permission_criteria(action):
+            actions.append(action)
+
+        with mock.patch.object(Post, 'permission_criteria',
+                               side_effect=permission_criteria):
+            resp = self.client.delete(
+                f'/post/delete-all{f"?soft={soft}" if soft else ""}',
+                data=json.dumps({'id_list': ids}),
+                content_type='application/json')
+        # every chunk is filtered with the permission of the delete
+        expected = Permission.WRITE if soft == 'true' \
+            else Permission.HARD_WRITE
+        self.assertEqual([expected] * 3, actions)
+        return resp
+
+    def test_delete_all_multiple_chunks(self):
+        ids = self.create_posts(5)
+
+        resp = self.delete_all(ids)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(ids, json.loads(resp.data))
+        with app.app_context():
+            self.assertEqual(
+                0, Post.query.raw().filter(Post.id.in_(ids)).count())
+
+    def test_soft_delete_all_multiple_chunks(self):
+        ids = self.create_posts(5)
+
+        resp = self.delete_all(ids, soft='true')
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(ids, json.loads(resp.data))
+        with app.app_context():
+            deleted = Post.query.raw().filter(Post.id.in_(ids)).all()
+            self.assertTrue(all(obj.deleted for obj in deleted))
+            self.assertEqual(5, len(deleted))
+
+    def test_delete_all_soft_false(self):
+        ids = self.create_posts(5)
+
+        resp = self.delete_all(ids, soft='false')
+
+        self.assertEqual(200, resp.status_code)
+        with app.app_context():
+            self.assertEqual(
+                0, Post.query.raw().filter(Post.id.in_(ids)).count())
+
+    def bulk_create(self, count, mode='atomic'):
+        return self.client.post(
+            f'/post/bulk?mode={mode}',
+            data=json.dumps([{'some_text': f'bulk {i}'}
+                             for i in range(count)]),
+            content_type='application/json')
+
+    def test_bulk_create_inserts_one_statement_per_chunk(self):
+        for count, chunk_size, chunks in ((4, 2, 2), (20, 2, 10),
+                                          (20, 10, 2)):
+            post_api.bulk_chunk_size = chunk_size
+            with count_statements() as statements:
+                resp = self.bulk_create(count)
+
+            self.assertEqual(200, resp.status_code)
+            results = [r['result'] for r in json.loads(resp.data)]
+            # ids of the rows are matched with the items
+            self.assertEqual([f'bulk {i}' for i in range(count)],
+                             [r['some_text'] for r in results])
+            with app.app_context():
+                self.assertEqual(
+                    [f'bulk {i}' for i in range(count)],
+                    [Post.query.get(r['id']).some_text for r in results])
+            self.assertIsNone(results[0]['deleted_at'])
+            self.assertIsNone(results[0]['json_columns'])
+            self.assertFalse(results[0]['deleted'])
+
+            def executed(prefix):
+                return sum(s.startswith(prefix) for s in statements)
+
+            # the number of statements depends on chunks, not items
+            self.assertEqual(chunks, executed('INSERT INTO post'))
+            self.assertEqual(chunks, executed('INSERT INTO user_action'))
+            # objects are reloaded after commit by chunk
+            self.assertEqual(chunks, sum(
+                s.startswith('SELECT') and 'FROM post' in s
+                for s in statements))
+
+    def test_bulk_create_best_effort_permission_denied(self):
+        def check_permission(obj, action):
+            if obj.some_text == 'bulk 1':
+                abort(403)
+
+        with mock.patch.object(post_api, 'check_permission',
+                               side_effect=check_permission):
+            resp = self.bulk_create(3, mode='best-effort')
+
+        self.assertEqual(200, resp.status_code)
+        results = json.loads(resp.data)
+        self.assertEqual({'': 'Permission denied'}, results[1]['errors'])
+        self.assertEqual('bulk 0', results[0]['result']['some_text'])
+        self.assertEqual('bulk 2', results[2]['result']['some_text'])
+
+    def test_bulk_update_statements_do_not_grow_with_items(self):
+        def bulk_update(ids):
+            return self.client.patch(
+                '/post/bulk',
+                data=json.dumps([{'id': i, 'some_text': 'updated'}
+                                 for i in ids]),
+                content_type='application/json')
+
+        few, many = self.create_posts(4), self.create_posts(20)
+        with count_statements() as few_statements:
+            self.assertEqual(200, bulk_update(few).status_code)
+        with count_statements() as many_statements:
+            resp = bulk_update(many)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(['updated'] * 20, [r['result']['some_text']
+                                            for r in json.loads(resp.data)])
+        selects = [sum(s.startswith('SELECT') for s in statements)
+                   for statements in (few_statements, many_statements)]
+        # objects are loaded and reloaded after commit by chunks of ids
+        self.assertEqual([4, 20], selects)
+        self.assertEqual(10, sum('INSERT INTO user_action' in s
+                                 for s in many_statements))
+
+    def test_bulk_update_invalid_ids(self):
+        id, = self.create_posts(1)
+
+        resp = self.client.patch(
+            '/post/bulk?mode=best-effort',
+            data=json.dumps([{'id': [id]}, {'id': True}, {'id': str(id)},
+                             {'id': id, 'some_text': 'updated'}]),
+            content_type='application/json')
+
+        self.assertEqual(200, resp.status_code)
+        results = json.loads(resp.data)
+        self.assertEqual([{'id': 'Should be an integer'}] * 3,
+                         [r['errors'] for r in results[:3]])
+        self.assertEqual('updated', results[3]['result']['some_text'])
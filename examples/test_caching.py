@@ -0,0 +1,75 @@
+import json
+import unittest
+
+from flask_vanilla import db, cache, BaseEntity, ModelAPI
+from flask_vanilla.model import invalidate_all_permissions
+from examples.example1 import app
+
+
+class Notice(BaseEntity, db.Model):
+    text = db.Column(db.String)
+
+
+notice_api = ModelAPI(Notice, app=app, cache_timeout=60)
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        cache.clear()
+        with app.app_context():
+            db.create_all()
+        self.id = self.create('cached')
+
+    def create(self, text):
+        resp = self.client.post('/notice', data=json.dumps({'text': text}),
+                                content_type='application/json')
+        self.assertEqual(200, resp.status_code)
+        return json.loads(resp.data)['id']
+
+    def get(self, path):
+        resp = self.client.get(path)
+        self.assertEqual(200, resp.status_code)
+        return resp.headers['X-Cache'], json.loads(resp.data)
+
+    def test_hit_after_miss(self):
+        path = f'/notice/{self.id}'
+        stats = notice_api.response_cache.stats()
+        self.assertEqual('MISS', self.get(path)[0])
+
+        status, obj = self.get(path)
+
+        self.assertEqual('HIT', status)
+        self.assertEqual('cached', obj['text'])
+        self.assertEqual(stats['hits'] + 1,
+                         notice_api.response_cache.stats()['hits'])
+        # query args are part of the key
+        self.assertEqual('MISS', self.get(f'{path}?fields=id')[0])
+
+    def test_write_invalidates_lists(self):
+        self.assertEqual('MISS', self.get('/notice/')[0])
+        self.assertEqual('HIT', self.get('/notice/')[0])
+
+        self.create('new')
+
+        status, items = self.get('/notice/')
+        self.assertEqual('MISS', status)
+        self.assertIn('new', [item['text'] for item in items])
+
+    def test_bulk_create_invalidates_lists(self):
+        self.assertEqual('MISS', self.get('/notice/')[0])
+        self.assertEqual('HIT', self.get('/notice/')[0])
+
+        resp = self.client.post('/notice/bulk',
+                                data=json.dumps([{'text': 'bulk'}]),
+                                content_type='application/json')
+        self.assertEqual(200, resp.status_code)
+
+        status, items = self.get('/notice/')
+        self.assertEqual('MISS', status)
+        self.assertIn('bulk', [item['text'] for item in items])
+
+    def test_permission_change_invalidates(self):
+        self.get(f'/notice/{self.id}')
+        invalidate_all_permissions()
+        self.assertEqual('MISS', self.get(f'/notice/{self.id}')[0])
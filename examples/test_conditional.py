@@ -0,0 +1,57 @@
+import json
+import unittest
+
+from examples.example1 import app
+
+
+class ConditionalRequestsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        resp = self.client.post('/post',
+                                data=json.dumps({'some_text': 'etag'}),
+                                content_type='application/json')
+        self.path = f'/post/{json.loads(resp.data)["id"]}'
+
+    def update(self, text, headers=None):
+        return self.client.put(self.path,
+                               data=json.dumps({'some_text': text}),
+                               content_type='application/json',
+                               headers=headers)
+
+    def test_get_not_modified(self):
+        etag = self.client.get(self.path).headers['ETag']
+
+        resp = self.client.get(self.path, headers={'If-None-Match': etag})
+        self.assertEqual(304, resp.status_code)
+
+        self.update('changed')
+        resp = self.client.get(self.path, headers={'If-None-Match': etag})
+        self.assertEqual(200, resp.status_code)
+        self.assertNotEqual(etag, resp.headers['ETag'])
+
+    def test_list_not_modified(self):
+        etag = self.client.get('/post/').headers['ETag']
+
+        resp = self.client.get('/post/', headers={'If-None-Match': etag})
+        self.assertEqual(304, resp.status_code)
+
+        self.update('changed')
+        resp = self.client.get('/post/', headers={'If-None-Match': etag})
+        self.assertEqual(200, resp.status_code)
+
+    def test_update_if_match(self):
+        etag = self.client.get(self.path).headers['ETag']
+
+        resp = self.update('first', {'If-Match': etag})
+        self.assertEqual(200, resp.status_code)
+
+        resp = self.update('second', {'If-Match': etag})
+        self.assertEqual(412, resp.status_code)
+
+    def test_update_if_match_etag_of_other_args(self):
+        etag = self.client.get(f'{self.path}?fields=id,some_text') \
+            .headers['ETag']
+        self.assertEqual(etag, self.client.get(self.path).headers['ETag'])
+
+        resp = self.update('first', {'If-Match': etag})
+        self.assertEqual(200, resp.status_code)
@@ -1,8 +1,8 @@
 import unittest
-from flask_vanilla import BaseCRUDTestCase
+from flask_vanilla import BaseCRUDTestCaseMixin
 from examples.example1 import app, post_api
 
-class PostTestCase(unittest.TestCase, BaseCRUDTestCase):
+class PostTestCase(unittest.TestCase, BaseCRUDTestCaseMixin):
     model_api = post_api
     app = app
 
@@ -17,3 +17,12 @@ class PostTestCase(unittest.TestCase, BaseCRUDTestCase):
 
     def get_update_obj_fixture(self):
         return {'some_text': 'blabla2', 'json_columns': [1, 2, 4]}
+
+    def test_repeated_query_limit_per_request(self):
+        self.max_query_repeats = 1
+        resp = self.client().get(f'/{self.prefix}/')
+
+        self.assertEqual(500, resp.status_code)
+        self.assertIsNone(app.config['SQL_REPEATED_QUERY_LIMIT'])
+        resp = app.test_client().get(f'/{self.prefix}/')
+        self.assertEqual(200, resp.status_code)
@@ -0,0 +1,111 @@
+import json
+import unittest
+
+from flask_vanilla import db, BaseEntity, Json, ModelAPI
+from examples.example1 import app, Post
+
+
+class Device(BaseEntity, db.Model):
+    name = db.Column(db.String)
+    meta = db.Column(Json(native=True))
+    price = db.Column(db.Numeric(10, 2))
+
+
+device_api = ModelAPI(Device, app=app)
+
+
+class JsonFilterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            Device.query.raw().delete()
+            db.session.commit()
+        for size, tags in [(5, ['red']), (7, ['blue']), (9, ['red'])]:
+            resp = self.client.post(
+                '/device',
+                data=json.dumps({'name': 'old',
+                                 'meta': {'size': size, 'tags': tags}}),
+                content_type='application/json')
+            self.assertEqual(200, resp.status_code)
+
+    def bulk_update(self, filters):
+        return self.client.patch(
+            '/device/bulk',
+            data=json.dumps({'filter': filters, 'set': {'name': 'new'}}),
+            content_type='application/json')
+
+    def updated_sizes(self, resp):
+        self.assertEqual(200, resp.status_code)
+        return sorted(r['result']['meta']['size']
+                      for r in json.loads(resp.data))
+
+    def test_query_string_values(self):
+        resp = self.client.get('/device/?meta.size-min=7&meta.tags.0=red')
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual([9], [d['meta']['size']
+                               for d in json.loads(resp.data)])
+
+    def test_bulk_update_non_string_values(self):
+        self.assertEqual([5], self.updated_sizes(
+            self.bulk_update({'meta.size': 5})))
+        self.assertEqual([5, 7], self.updated_sizes(
+            self.bulk_update({'meta.size-in': [5, 7]})))
+        self.assertEqual([7, 9], self.updated_sizes(
+            self.bulk_update({'meta.size-min': 6.5})))
+
+    def test_bulk_update_non_scalar_value(self):
+        resp = self.bulk_update({'meta.size': {'min': 5}})
+        self.assertEqual(400, resp.status_code)
+
+
+class FilterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            Post.query.raw().filter(Post.some_text.like('flt-%')).delete(
+                synchronize_session=False)
+            posts = [Post(some_text=f'flt-{name}', user_id=1)
+                     for name in 'abc']
+            db.session.add_all(posts)
+            db.session.commit()
+            self.ids = {post.some_text[-1]: post.id for post in posts}
+
+    def texts(self, params, status=200):
+        resp = self.client.get(f'/post/?some_text-prefix=flt-&{params}')
+        self.assertEqual(status, resp.status_code)
+        if status == 200:
+            return sorted(p['some_text'][-1] for p in json.loads(resp.data))
+
+    def test_operators(self):
+        self.assertEqual(['a', 'c'], self.texts('some_text-in=flt-a,flt-c'))
+        self.assertEqual(['b', 'c'], self.texts(f'id-min={self.ids["b"]}'))
+        self.assertEqual(['a', 'b'], self.texts(f'id-max={self.ids["b"]}'))
+        self.assertEqual(['a', 'c'], self.texts('some_text-ne=flt-b'))
+        self.assertEqual(['b'], self.texts('some_text-like=%b'))
+        self.assertEqual(['a', 'b', 'c'],
+                         self.texts('created_at-min=2000-01-01T00:00:00'))
+
+    def test_or_group(self):
+        self.assertEqual(['a'], self.texts('some_text|access-prefix=flt-a'))
+
+    def test_invalid_filters(self):
+        self.texts('id-min=abc', status=400)
+        self.texts('created_at-min=yesterday', status=400)
+        self.texts('missing=1', status=400)
+        self.texts('some_text|missing-prefix=a', status=400)
+
+    def test_invalid_number(self):
+        resp = self.client.get('/device/?price=abc')
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(200, self.client.get('/device/?price-min=1.5')
+                         .status_code)
+
+    def test_private_fields_not_filtered_or_sorted(self):
+        for params in ('number1=1', 'number1-min=0', 'number1-max=0',
+                       'name|number1-in=1', 'sort_by=number1'):
+            resp = self.client.get(f'/unique_name_model/?{params}')
+            self.assertEqual(400, resp.status_code, params)
+        self.assertEqual(200, self.client.get(
+            '/unique_name_model/?number2-min=0&sort_by=number2').status_code)
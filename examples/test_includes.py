@@ -0,0 +1,47 @@
+import json
+import unittest
+
+from examples.example1 import app, db, Post, Comment
+from examples.test_bulk import count_statements
+
+
+class IncludeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+
+    def create_comments(self, text, count):
+        with app.app_context():
+            for i in range(count):
+                post = Post(some_text=f'{text} {i}', user_id=1)
+                db.session.add(Comment(text=text, post=post, user_id=1))
+            db.session.commit()
+
+    def list_comments(self, text):
+        with count_statements() as statements:
+            resp = self.client.get(f'/comment/?text={text}&include=post')
+        self.assertEqual(200, resp.status_code)
+        return json.loads(resp.data), statements
+
+    def test_include_to_one(self):
+        self.create_comments('include few', 2)
+        self.create_comments('include many', 6)
+
+        few, few_statements = self.list_comments('include few')
+        many, many_statements = self.list_comments('include many')
+
+        self.assertEqual(6, len(many))
+        self.assertEqual(sorted(f'include many {i}' for i in range(6)),
+                         sorted(c['post']['some_text'] for c in many))
+        # related objects are loaded by one query, not per comment
+        self.assertEqual(len(few_statements), len(many_statements))
+
+    def test_unknown_relation(self):
+        resp = self.client.get('/comment/?include=missing')
+        self.assertEqual(400, resp.status_code)
+
+    def test_relationships_are_cached(self):
+        # None if SQLAlchemy can not cache statements (loaders) of the
+        # relationship
+        for relationship in (Comment.post, Post.user):
+            self.assertIsNotNone(
+                relationship.property._generate_cache_key())
@@ -0,0 +1,29 @@
+import unittest
+
+from sqlalchemy import inspect
+
+from flask_vanilla import db, Role
+from examples.example1 import app, Post, UniqueNameModel
+
+
+def index_columns(table):
+    with app.app_context():
+        return sorted(tuple(index['column_names'])
+                      for index in inspect(db.engine).get_indexes(table))
+
+
+class IndexesTestCase(unittest.TestCase):
+    def test_entity_indexes(self):
+        self.assertEqual([('deleted', 'id'), ('user_id', 'access')],
+                         index_columns(Post.__tablename__))
+
+    def test_unique_name_constraint(self):
+        with app.app_context():
+            constraints = inspect(db.engine).get_unique_constraints(
+                UniqueNameModel.__tablename__)
+        self.assertIn(['name', 'user_id'],
+                      [c['column_names'] for c in constraints])
+
+    def test_role_without_id_index(self):
+        self.assertEqual([], list(Role.__table__.indexes))
+        self.assertEqual([], index_columns(Role.__tablename__))
@@ -0,0 +1,86 @@
+import json
+import unittest
+
+from flask_vanilla import db, BaseEntity, ModelAPI, Json, LazyJson
+from examples.example1 import app
+
+
+class Document(BaseEntity, db.Model):
+    body = db.Column(Json(lazy=True))
+    archive = db.Column(Json(compress='zlib', threshold=64))
+
+
+document_api = ModelAPI(Document, app=app)
+
+
+class JsonTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+
+    def create(self, **values):
+        resp = self.client.post('/document', data=json.dumps(values),
+                                content_type='application/json')
+        self.assertEqual(200, resp.status_code)
+        return json.loads(resp.data)
+
+    def stored(self, id, column):
+        with app.app_context():
+            return db.session.execute(
+                db.select(db.column(column)).select_from(
+                    Document.__table__).where(Document.id == id)).scalar()
+
+    def test_lazy_decoded_on_first_access(self):
+        id = self.create(body={'tags': ['a', 'b'], 'size': 2})['id']
+
+        with app.app_context():
+            body = Document.query.get(id).body
+            self.assertIsInstance(body, LazyJson)
+            self.assertFalse(body.loaded)
+
+            self.assertEqual(['a', 'b'], body['tags'])
+            self.assertTrue(body.loaded)
+            self.assertEqual({'tags': ['a', 'b'], 'size': 2}, body)
+
+    def test_lazy_not_accessed_written_back_as_stored(self):
+        id = self.create(body={'size': 1})['id']
+        stored = self.stored(id, 'body')
+
+        with app.app_context():
+            obj = Document.query.get(id)
+            obj.body = obj.body  # marks the column as modified
+            db.session.commit()
+            self.assertFalse(obj.body.loaded)
+
+        self.assertEqual(stored, self.stored(id, 'body'))
+
+    def test_lazy_in_response(self):
+        id = self.create(body={'size': 3, 'tags': []})['id']
+
+        resp = self.client.get(f'/document/{id}')
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual({'size': 3, 'tags': []},
+                         json.loads(resp.data)['body'])
+
+    def test_compressed_above_threshold(self):
+        archive = {'items': list(range(100))}
+        obj = self.create(archive=archive)
+
+        self.assertEqual(archive, obj['archive'])
+        stored = self.stored(obj['id'], 'archive')
+        self.assertTrue(bytes(stored).startswith(b'zlib:'))
+        self.assertLess(len(stored), len(json.dumps(archive)))
+
+        resp = self.client.get(f'/document/{obj["id"]}')
+        self.assertEqual(archive, json.loads(resp.data)['archive'])
+
+    def test_not_compressed_below_threshold(self):
+        obj = self.create(archive={'items': [1, 2]})
+
+        stored = bytes(self.stored(obj['id'], 'archive'))
+        self.assertEqual({'items': [1, 2]}, json.loads(stored.decode()))
+
+        resp = self.client.get(f'/document/{obj["id"]}')
+        self.assertEqual({'items': [1, 2]}, json.loads(resp.data)['archive'])
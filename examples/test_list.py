@@ -0,0 +1,238 @@
+import base64
+import json
+import unittest
+from unittest import mock
+
+from flask_vanilla import ModelAPI
+from flask_vanilla.counting import CountStrategy
+from flask_vanilla.filters import parse_bool
+from examples.example1 import app, db, post_api, Post
+from examples.test_bulk import count_statements
+
+
+class CountedPostAPI(ModelAPI):
+    def query_access_filter(self, query):
+        return query.filter(Post.some_text == 'counted')
+
+
+counted_post_api = CountedPostAPI(Post, app=app, name='counted_post',
+                                  count_strategy=CountStrategy.CACHED)
+
+
+class CursorPaginationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        with app.app_context():
+            for text in [None, 'b', None, 'a', 'b', None, 'c']:
+                db.session.add(Post(some_text=text, user_id=1))
+            db.session.commit()
+            rows = Post.query.with_entities(Post.id, Post.some_text).all()
+        # nulls are the smallest value
+        self.expected = [row.id for row in sorted(
+            rows, key=lambda r: (r.some_text is not None,
+                                 r.some_text or '', r.id))]
+
+    def page_through(self, params):
+        ids, cursor = [], ''
+        while cursor is not None:
+            resp = self.client.get(
+                f'/post/?after={cursor}&limit=2&sort_by=some_text{params}')
+            self.assertEqual(200, resp.status_code)
+            result = json.loads(resp.data)
+            ids.extend(item['id'] for item in result['items'])
+            cursor = result['next']
+        return ids
+
+    def test_null_sort_values_ascending(self):
+        self.assertEqual(self.expected, self.page_through(''))
+
+    def test_null_sort_values_descending(self):
+        self.assertEqual(self.expected[::-1],
+                         self.page_through('&decs=true'))
+
+    def test_decs_false(self):
+        self.assertEqual(self.expected, self.page_through('&decs=false'))
+
+    def get_after(self, cursor, params=''):
+        return self.client.get(f'/post/?after={cursor}&limit=2{params}')
+
+    def test_invalid_cursor(self):
+        # well-formed, but of the wrong length, non-integer id or other
+        # sort_by
+        for values in ([1], [1, 2], ['some_text', 'a', 'b'],
+                       ['some_text', None, True], ['id', 'a', 1], {}):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps(values).encode()).decode()
+            resp = self.get_after(cursor, '&sort_by=some_text')
+            self.assertEqual(400, resp.status_code)
+            self.assertIn(b'Invalid cursor', resp.data)
+
+    def test_cursor_of_other_sort_by(self):
+        cursor = json.loads(
+            self.get_after('', '&sort_by=some_text').data)['next']
+
+        for params in ('', '&sort_by=created_at'):
+            resp = self.get_after(cursor, params)
+            self.assertEqual(400, resp.status_code)
+            self.assertIn(b'Invalid cursor', resp.data)
+
+        cursor = json.loads(self.get_after('').data)['next']
+        resp = self.get_after(cursor, '&sort_by=some_text')
+        self.assertEqual(400, resp.status_code)
+
+
+class CountTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        with app.app_context():
+            posts = [Post(some_text='count', user_id=1) for _ in range(3)]
+            db.session.add_all(posts)
+            db.session.commit()
+            posts[0].deleted = True
+            db.session.commit()
+            self.deleted_id = posts[0].id
+
+    def get_page(self, params=''):
+        resp = self.client.get(f'/post/?page=1&some_text=count{params}')
+        self.assertEqual(200, resp.status_code)
+        return resp
+
+    def count(self, params=''):
+        return json.loads(self.get_page(params).data)['count']
+
+    def test_cached_count_with_deleted(self):
+        def with_deleted_requested(filters):
+            return filters.get('with-deleted', type=parse_bool, default=False)
+
+        with mock.patch.object(post_api, 'count_strategy',
+                               CountStrategy.CACHED), \
+                mock.patch.object(post_api, '_with_deleted_requested',
+                                  side_effect=with_deleted_requested):
+            count = self.count()
+            with app.app_context():
+                deleted = Post.query.raw().filter_by(
+                    some_text='count', deleted=True).count()
+            self.assertEqual(count + deleted,
+                             self.count('&with-deleted=true'))
+            self.assertEqual(count, self.count())
+
+    def test_invalid_limit(self):
+        for limit in ('-1', '0', 'abc', str(post_api.max_results + 1)):
+            resp = self.client.get(f'/post/?page=1&limit={limit}')
+            self.assertEqual(400, resp.status_code, limit)
+        # the max is valid
+        self.get_page(f'&limit={post_api.max_results}')
+
+    def test_cached_count_per_api(self):
+        with app.app_context():
+            db.session.add(Post(some_text='counted', user_id=1))
+            db.session.commit()
+            counted = Post.query.filter_by(some_text='counted').count()
+
+        with mock.patch.object(post_api, 'count_strategy',
+                               CountStrategy.CACHED):
+            total = json.loads(self.client.get('/post/?page=1').data)
+            own = json.loads(self.client.get('/counted_post/?page=1').data)
+
+        self.assertEqual(counted, own['count'])
+        self.assertGreater(total['count'], own['count'])
+
+    def test_list_etag_without_count(self):
+        with mock.patch.object(post_api, 'count_strategy',
+                               CountStrategy.NONE):
+            with count_statements() as statements:
+                etag = self.get_page().headers['ETag']
+            self.assertFalse(any('count(' in s for s in statements))
+
+            # hard delete does not change max(updated_at)
+            resp = self.client.delete(f'/post/{self.deleted_id}/hard-delete')
+            self.assertEqual(200, resp.status_code)
+            self.assertNotEqual(etag, self.get_page().headers['ETag'])
+
+
+class StreamTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        with app.app_context():
+            db.session.add_all([Post(some_text='stream', user_id=1)
+                                for _ in range(3)])
+            db.session.commit()
+            self.count = Post.query.filter_by(some_text='stream').count()
+
+    def test_ndjson(self):
+        resp = self.client.get('/post/?some_text=stream',
+                               headers={'Accept': 'application/x-ndjson'})
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual('application/x-ndjson', resp.mimetype)
+        self.assertTrue(resp.is_streamed)
+        lines = resp.get_data(as_text=True).splitlines()
+        self.assertEqual(self.count, len(lines))
+        self.assertTrue(all(json.loads(line)['some_text'] == 'stream'
+                            for line in lines))
+
+    def test_json_array(self):
+        resp = self.client.get('/post/?some_text=stream&stream=1&limit=2')
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual('application/json', resp.mimetype)
+        self.assertEqual(2, len(json.loads(resp.data)))
+
+    def test_false_values_do_not_stream(self):
+        for value in ('0', 'false', 'no'):
+            resp = self.client.get(f'/post/?some_text=stream&stream={value}')
+
+            self.assertEqual(200, resp.status_code)
+            # streamed lists have no ETag
+            self.assertIn('ETag', resp.headers)
+
+    def test_limit_is_capped_by_max_stream_results(self):
+        with mock.patch.object(post_api, 'max_stream_results', 2):
+            resp = self.client.get(
+                '/post/?some_text=stream&stream=true&limit=1000')
+
+        self.assertEqual(200, resp.status_code)
+        self.assertNotIn('ETag', resp.headers)
+        self.assertEqual(2, len(json.loads(resp.data)))
+
+
+class FieldsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        with app.app_context():
+            post = Post(some_text='fields', json_columns=[1, 2], user_id=1)
+            db.session.add(post)
+            db.session.commit()
+            self.post_id = post.id
+
+    def get(self, path):
+        with count_statements() as statements:
+            resp = self.client.get(path)
+        self.assertEqual(200, resp.status_code)
+        select = next(s for s in statements if s.startswith('SELECT'))
+        return json.loads(resp.data), select
+
+    def test_list_fields(self):
+        items, select = self.get(f'/post/?id={self.post_id}&fields=id')
+
+        self.assertEqual([{'id': self.post_id}], items)
+        self.assertNotIn('post.some_text', select)
+
+    def test_heavy_columns_deferred_in_list(self):
+        items, select = self.get(f'/post/?id={self.post_id}')
+
+        self.assertEqual('fields', items[0]['some_text'])
+        self.assertNotIn('json_columns', items[0])
+        self.assertNotIn('post.json_columns', select)
+
+        items, _ = self.get(f'/post/?id={self.post_id}'
+                            f'&fields=id,json_columns')
+        self.assertEqual([1, 2], items[0]['json_columns'])
+
+    def test_detail_fields(self):
+        obj, _ = self.get(f'/post/{self.post_id}?fields=some_text')
+        self.assertEqual({'some_text': 'fields'}, obj)
+
+    def test_unknown_field(self):
+        resp = self.client.get('/post/?fields=id,missing')
+        self.assertEqual(400, resp.status_code)
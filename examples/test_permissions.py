@@ -0,0 +1,65 @@
+import unittest
+import uuid
+
+from flask_vanilla import db, DefaultRoles, Permission, Role
+from examples.example1 import app
+
+
+class CompiledPermissionsTestCase(unittest.TestCase):
+    def test_roles_and_permissions(self):
+        user = app.User(roles=[DefaultRoles.TENANT_ADMIN])
+
+        self.assertTrue(user.has_role(DefaultRoles.TENANT_ADMIN))
+        self.assertTrue(user.has_role('tenant-admin'))
+        self.assertFalse(user.has_role(DefaultRoles.SUPER_ADMIN))
+        self.assertTrue(user.has_permission(Permission.HARD_WRITE))
+        self.assertFalse(user.has_permission(Permission.READ_DELETED))
+        # compiled once per instance
+        self.assertIs(user.compiled_permissions, user.compiled_permissions)
+
+    def test_cached_permissions_invalidated_by_role_change(self):
+        name = f'role-{uuid.uuid4().hex}'
+        with app.app_context():
+            role = Role(name=name, permissions=[
+                Permission(type=Permission.READ, model='post')])
+            user = app.User(name=name, roles=[role])
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.id
+            db.session.remove()
+
+            user = app.User.query.get(user_id)
+            self.assertTrue(user.has_permission(Permission.READ, 'post'))
+            self.assertFalse(user.has_permission(Permission.WRITE, 'post'))
+            db.session.remove()
+
+            role = Role.query.get(name)
+            role.permissions.append(
+                Permission(type=Permission.WRITE, model='post'))
+            db.session.commit()
+            db.session.remove()
+
+            user = app.User.query.get(user_id)
+            self.assertTrue(user.has_permission(Permission.WRITE, 'post'))
+
+    def test_cached_permissions_invalidated_by_executed_insert(self):
+        name = f'role-{uuid.uuid4().hex}'
+        with app.app_context():
+            user = app.User(name=name, roles=[Role(name=name)])
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.id
+            db.session.remove()
+
+            user = app.User.query.get(user_id)
+            self.assertFalse(user.has_permission(Permission.WRITE, 'post'))
+            db.session.remove()
+
+            # as bulk create inserts, without a flush
+            db.session.execute(Permission.__table__.insert().values(
+                type=Permission.WRITE, model='post', role_name=name))
+            db.session.commit()
+            db.session.remove()
+
+            user = app.User.query.get(user_id)
+            self.assertTrue(user.has_permission(Permission.WRITE, 'post'))
@@ -0,0 +1,79 @@
+import json
+import unittest
+from unittest import mock
+
+from flask_vanilla import db, BaseEntity, ModelAPI, Permission
+from examples.example1 import app, Post
+from examples.test_bulk import count_statements
+
+
+class Reply(BaseEntity, db.Model):
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'))
+    # protected - referenced post is verified on create
+    post = db.relationship('Post', protected=True)
+    text = db.Column(db.String)
+
+
+reply_api = ModelAPI(Reply, app=app)
+
+
+class ReferencesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            posts = [Post(some_text='referenced', user_id=1)
+                     for _ in range(3)]
+            db.session.add_all(posts)
+            db.session.commit()
+            posts[2].deleted = True
+            db.session.commit()
+            self.post_ids = [post.id for post in posts]
+
+    def bulk_create(self, post_ids):
+        with count_statements() as statements:
+            resp = self.client.post(
+                '/reply/bulk?mode=best-effort',
+                data=json.dumps([{'post_id': post_id, 'text': 'reply'}
+                                 for post_id in post_ids]),
+                content_type='application/json')
+        self.assertEqual(200, resp.status_code)
+        return json.loads(resp.data), statements
+
+    def test_bulk_create_verifies_posts_in_one_query(self):
+        first, second, deleted = self.post_ids
+        results, statements = self.bulk_create(
+            [first, second, first, deleted, None, -1])
+
+        self.assertEqual([first, second, first],
+                         [r['result']['post_id'] for r in results[:3]])
+        self.assertEqual(
+            {'post_id': f'{deleted} : object with such id not found'},
+            results[3]['errors'])
+        self.assertEqual({'post_id': '-1 : object with such id not found'},
+                         results[5]['errors'])
+        # no reference is not verified
+        self.assertIsNone(results[4]['result']['post_id'])
+        self.assertEqual(1, sum(s.startswith('SELECT') and 'FROM post' in s
+                                for s in statements))
+
+    def test_reference_permission_denied(self):
+        first, second, _ = self.post_ids
+
+        def check_permission(post, action):
+            return post.id != second or action == Permission.READ
+
+        with mock.patch.object(Post, '_check_permission', autospec=True,
+                               side_effect=check_permission):
+            results, _ = self.bulk_create([first, second])
+
+        self.assertIn('result', results[0])
+        self.assertEqual({'post_id': f'{second} : permission denied'},
+                         results[1]['errors'])
+
+    def test_create_with_missing_post(self):
+        resp = self.client.post('/reply',
+                                data=json.dumps({'post_id': -1}),
+                                content_type='application/json')
+        self.assertNotEqual(200, resp.status_code)
+        self.assertIn(b'object with such id not found', resp.data)
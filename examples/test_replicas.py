@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask_vanilla import db, cache, BaseEntity, ModelAPI
+from examples.example1 import app, Post
+
+
+class Bulletin(BaseEntity, db.Model):
+    text = db.Column(db.String)
+
+
+bulletin_api = ModelAPI(Bulletin, app=app, cache_timeout=60)
+
+
+class ReplicaTestCase(unittest.TestCase):
+    """The replica is a copy of the primary SQLite file, rows are changed
+    in the copy to tell where a read was executed"""
+
+    def setUp(self):
+        self.client = app.test_client()
+        self.tmp = tempfile.TemporaryDirectory()
+        cache.clear()
+        with app.app_context():
+            db.create_all()
+            post = Post(some_text='primary', user_id=1)
+            bulletin = Bulletin(text='primary', user_id=1)
+            db.session.add_all([post, bulletin])
+            db.session.commit()
+            self.post_id, self.bulletin_id = post.id, bulletin.id
+            primary = db.engine.url.database
+            db.engine.dispose()
+        self.replica = os.path.join(self.tmp.name, 'replica.db')
+        shutil.copy(primary, self.replica)
+        self.use_replicas(f'sqlite:///{self.replica}')
+        with app.replica_pool.engines[0].begin() as connection:
+            connection.exec_driver_sql(
+                "UPDATE post SET some_text = 'replica'")
+            connection.exec_driver_sql(
+                "UPDATE bulletin SET text = 'replica'")
+
+    def tearDown(self):
+        self.use_replicas()
+        cache.clear()
+        self.tmp.cleanup()
+
+    def use_replicas(self, *uris):
+        app.config['SQLALCHEMY_REPLICA_URIS'] = list(uris)
+        app.replica_pool.dispose()
+
+    def get(self, path, field='some_text'):
+        resp = self.client.get(path)
+        self.assertEqual(200, resp.status_code)
+        return json.loads(resp.data)[field], resp
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual('replica',
+                         self.get(f'/post/{self.post_id}')[0])
+        self.assertEqual(['replica'], [p['some_text'] for p in json.loads(
+            self.client.get(f'/post/?id={self.post_id}').data)])
+        self.assertEqual(2, app.replica_pool.stats()[0]['reads'])
+
+    def test_writes_go_to_primary(self):
+        resp = self.client.put(f'/post/{self.post_id}',
+                               data=json.dumps({'some_text': 'updated'}),
+                               content_type='application/json')
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual('updated', json.loads(resp.data)['some_text'])
+        with app.app_context():
+            self.assertEqual('updated', Post.query.get(self.post_id).some_text)
+
+    def test_sticky_reads_after_write(self):
+        self.client.put(f'/post/{self.post_id}',
+                        data=json.dumps({'some_text': 'updated'}),
+                        content_type='application/json')
+
+        # the replica has not got the write yet, the user reads the primary
+        self.assertEqual('updated', self.get(f'/post/{self.post_id}')[0])
+        self.assertEqual(0, app.replica_pool.stats()[0]['reads'])
+
+        cache.clear()  # sticky window is over
+        self.assertEqual('replica', self.get(f'/post/{self.post_id}')[0])
+
+    def test_sticky_reads_after_bulk_create(self):
+        resp = self.client.post('/post/bulk',
+                                data=json.dumps([{'some_text': 'bulk'}]),
+                                content_type='application/json')
+        self.assertEqual(200, resp.status_code)
+
+        self.assertEqual('primary', self.get(f'/post/{self.post_id}')[0])
+        self.assertEqual(0, app.replica_pool.stats()[0]['reads'])
+
+    def test_sticky_reads_bypass_response_cache(self):
+        path = f'/bulletin/{self.bulletin_id}'
+        self.get(path, 'text')
+        text, resp = self.get(path, 'text')
+        self.assertEqual(('replica', 'HIT'), (text, resp.headers['X-Cache']))
+
+        self.client.post('/post', data=json.dumps({'some_text': 'new'}),
+                         content_type='application/json')
+
+        text, resp = self.get(path, 'text')
+        self.assertEqual('primary', text)
+        self.assertNotIn('X-Cache', resp.headers)
+
+    def test_fallback_to_primary_when_replica_is_down(self):
+        self.use_replicas(
+            f'sqlite:///{os.path.join(self.tmp.name, "missing", "r.db")}')
+
+        self.assertEqual('primary', self.get(f'/post/{self.post_id}')[0])
+        self.assertTrue(app.replica_pool.stats()[0]['down'])
+        # skipped until the retry timeout
+        self.assertEqual('primary', self.get(f'/post/{self.post_id}')[0])
+        self.assertEqual(1, app.replica_pool.stats()[0]['reads'])
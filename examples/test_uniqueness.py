@@ -0,0 +1,68 @@
+import json
+import unittest
+import uuid
+from unittest import mock
+
+from flask_vanilla.uniqueness import UniqueNegativeCache
+from examples.example1 import app, unique_name_model_api, UniqueNameModel
+from examples.test_bulk import count_statements
+
+
+class UniquenessTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        self.name = f'unique-{uuid.uuid4().hex}'
+        resp = self.create(self.name)
+        self.assertEqual(200, resp.status_code)
+
+    def create(self, name):
+        return self.client.post('/unique_name_model',
+                                data=json.dumps({'name': name}),
+                                content_type='application/json')
+
+    def is_unique(self, name):
+        resp = self.client.get(f'/unique_name_model/name/is-unique/{name}')
+        self.assertEqual(200, resp.status_code)
+        return json.loads(resp.data)['result']
+
+    def test_create_taken_name(self):
+        resp = self.create(self.name)
+        self.assertNotEqual(200, resp.status_code)
+        self.assertIn(b'Already taken', resp.data)
+
+    def test_is_unique(self):
+        with count_statements() as statements:
+            self.assertFalse(self.is_unique(self.name))
+        self.assertIn('EXISTS', statements[-1])
+        self.assertTrue(self.is_unique(f'{self.name}-free'))
+
+    def test_bulk_create_checks_names_in_batch(self):
+        free = f'{self.name}-free'
+        with count_statements() as statements:
+            resp = self.client.post(
+                '/unique_name_model/bulk?mode=best-effort',
+                data=json.dumps([{'name': free}, {'name': free},
+                                 {'name': self.name}]),
+                content_type='application/json')
+
+        self.assertEqual(200, resp.status_code)
+        results = json.loads(resp.data)
+        self.assertEqual(free, results[0]['result']['name'])
+        self.assertEqual({'name': 'Already taken'}, results[1]['errors'])
+        self.assertEqual({'name': 'Already taken'}, results[2]['errors'])
+        self.assertEqual(1, sum('unique_name_model.name IN' in s
+                                for s in statements))
+
+    def test_negative_cache(self):
+        # no false positives in practice, so the counts below are exact
+        unique_cache = UniqueNegativeCache(UniqueNameModel, error_rate=1e-9)
+        with mock.patch.object(unique_name_model_api, 'unique_cache',
+                               unique_cache):
+            self.assertTrue(self.is_unique(f'{self.name}-1'))
+            with count_statements() as statements:
+                self.assertTrue(self.is_unique(f'{self.name}-2'))
+                self.assertFalse(self.is_unique(self.name))
+
+        self.assertEqual(2, unique_cache.stats()['hits'])
+        # only the used value is checked in DB
+        self.assertEqual(1, len(statements))
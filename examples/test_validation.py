@@ -0,0 +1,50 @@
+import unittest
+from datetime import date, datetime
+
+from flask_vanilla import db, BaseModel
+from flask_vanilla.validation import (ModelValidationError, MutableValidator,
+                                      ValidateDate, ValidateDateTime)
+from examples.example1 import app, Post
+
+
+class Schedule(BaseModel, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date)
+    starts_at = db.Column(db.DateTime)
+    slots = db.Column(db.Integer)
+
+
+class Positive(MutableValidator):
+    def check_value(self, value):
+        return value > 0
+
+
+ValidateDate(Schedule.day, throw_exception=True)
+ValidateDateTime(Schedule.starts_at, throw_exception=True)
+Positive(Schedule.slots, throw_exception=True, message='Should be positive')
+
+
+class ValidationTestCase(unittest.TestCase):
+    def test_populate_validates_outside_of_request(self):
+        with app.app_context():
+            with self.assertRaises(ModelValidationError) as e:
+                Post().populate(some_text=1)
+        self.assertIn('some_text', e.exception.errors)
+
+    def test_date_validators_transform_strings(self):
+        schedule = Schedule()
+        schedule.day = '2020-01-31'
+        schedule.starts_at = '2020-01-31T10:00:00.000Z'
+        self.assertEqual(date(2020, 1, 31), schedule.day)
+        self.assertEqual(datetime(2020, 1, 31, 10), schedule.starts_at)
+
+    def test_validator_errors(self):
+        schedule = Schedule()
+        with self.assertRaises(ValueError):
+            schedule.day = 'not a date'
+        with self.assertRaisesRegex(ValueError, 'Should be positive'):
+            schedule.slots = 0
+        with app.app_context():
+            with self.assertRaises(ModelValidationError) as e:
+                schedule.populate(slots=-1)
+        self.assertEqual({'slots': 'Should be positive'}, e.exception.errors)
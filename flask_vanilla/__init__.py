@@ -1,38 +1,135 @@
 from datetime import datetime, date
 from logging.config import dictConfig
 from sqlalchemy import (types,
-                        TypeDecorator
+                        TypeDecorator,
+                        orm
                         )
 import json
-from flask import g, Flask, current_app
+import secrets
+import click
+from flask import g, Flask, current_app, has_app_context
+from flask.cli import AppGroup
 from json import JSONEncoder
-from flask_cache import Cache
-from flask_sqlalchemy import SQLAlchemy
-
-db = SQLAlchemy()
+from flask_caching import Cache
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:  # Flask < 2.2
+    DefaultJSONProvider = object
+
+from .column_utils import VanillaColumn, VanillaRelationshipProperty
+from .json_codecs import (register_codec, get_codec, LazyJson,  # noqa
+                          COMPRESSORS, compress, stored_text)
+
+
+class VanillaSession(SignallingSession):
+    """Reads of views wrapped with `replicas.read_from_replica` go to the
+    replica chosen for the request, flushes and bulk statements (and reads
+    after them) go to the primary"""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        replica = g.get('_vanilla_replica') if has_app_context() else None
+        if replica is None or self._flushing or g.get('_vanilla_wrote') or \
+                getattr(clause, 'is_dml', False) or (
+                mapper is not None and
+                mapper.persist_selectable.info.get('bind_key')):
+            return super(VanillaSession, self).get_bind(mapper, clause,
+                                                        **kwargs)
+        return replica
+
+
+class VanillaSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=VanillaSession, db=self, **options)
+
+
+db = VanillaSQLAlchemy()
+# extended before models are declared, see README
+db.Column = VanillaColumn
+db.relationship = VanillaRelationshipProperty
 cache = Cache()
 
 
 class Json(TypeDecorator):
+    """JSON value, encoded with `codec` (registered with `register_codec`,
+    JSON_CODEC config by default).
+    `native=True` - stored as JSONB on PostgreSQL, JSON on MySQL and SQLite
+    (JSON1), which allows JSON path filters of list endpoints.
+    `lazy=True` - loaded as LazyJson, decoded on first access.
+    `compress='zlib'` - binary column, values longer than `threshold` bytes
+    are compressed."""
+
+    impl = types.String
+
+    def __init__(self, *args, native=False, codec=None, lazy=False,
+                 compress=None, threshold=1024, **kwargs):
+        super(Json, self).__init__(*args, **kwargs)
+        if compress and compress not in COMPRESSORS:
+            raise ValueError(f'Unknown compression: {compress}')
+        if compress and native:
+            raise ValueError('Native JSON can not be compressed')
+        self.native = native
+        self.codec = codec
+        self.lazy = lazy
+        self.compress = compress
+        self.threshold = threshold
 
     @property
     def python_type(self):
         return object
 
-    impl = types.String
-
-    def process_bind_param(self, value, dialect):
-        return json.dumps(value, cls=VanillaJSONEncoder)
+    def load_dialect_impl(self, dialect):
+        if self.native:
+            if dialect.name == 'postgresql':
+                from sqlalchemy.dialects.postgresql import JSONB
+                return dialect.type_descriptor(JSONB())
+            if dialect.name in ('mysql', 'sqlite'):
+                return dialect.type_descriptor(types.JSON())
+        if self.compress:
+            return dialect.type_descriptor(types.LargeBinary())
+        return dialect.type_descriptor(self.impl)
+
+    # processors of the impl are skipped, so JSON types of dialects do not
+    # encode the value again
+    def bind_processor(self, dialect):
+        codec, method = self.codec, self.compress
+        threshold = self.threshold
+
+        def process(value):
+            if isinstance(value, LazyJson):
+                # not accessed values are written back as they were stored
+                text = get_codec(codec).dumps(value.value) if value.loaded \
+                    else value.raw_text()
+            else:
+                text = get_codec(codec).dumps(value)
+            if not method:
+                return text
+            data = text.encode()
+            return compress(data, method) if len(data) > threshold else data
+
+        return process
+
+    def result_processor(self, dialect, coltype):
+        if self.native and dialect.name == 'postgresql':
+            return None  # decoded by the driver
+        codec, lazy = self.codec, self.lazy
+
+        def process(value):
+            if value is None:
+                return None
+            if lazy:
+                return None if value in ('null', b'null') else \
+                    LazyJson(value, codec)
+            try:
+                return get_codec(codec).loads(stored_text(value))
+            except (ValueError, TypeError):
+                return None
+
+        return process
 
     def process_literal_param(self, value, dialect):
         return value
 
-    def process_result_value(self, value, dialect):
-        try:
-            return json.loads(value)
-        except (ValueError, TypeError):
-            return None
-
 
 def default_tenant(context):
     return context.current_parameters['user'].tenant_id
@@ -82,15 +179,56 @@ class UserMode:
 
 
 class VanillaJSONEncoder(JSONEncoder):
+    _raw_values = None
+
+    def encode(self, o):
+        # not decoded LazyJson values are encoded as placeholders and
+        # replaced with their stored text
+        self._raw_values, self._nonce = {}, secrets.token_hex(8)
+        try:
+            text = super().encode(o)
+        finally:
+            raw_values, self._raw_values = self._raw_values, None
+        for placeholder, raw in raw_values.items():
+            text = text.replace(super().encode(placeholder), raw, 1)
+        return text
+
     def default(self, o):
+        if isinstance(o, LazyJson):
+            if o.loaded or self._raw_values is None:
+                return o.value
+            placeholder = f'\x00{self._nonce}:{len(self._raw_values)}\x00'
+            self._raw_values[placeholder] = o.raw_text()
+            return placeholder
+
         if isinstance(o, (date, datetime)):
             return o.isoformat()
 
+        serializer = getattr(type(o), '__serializer__', None)
+        if serializer is not None:
+            return o.to_api()
+
         return super().default(o)
 
 
+register_codec('json', lambda value: json.dumps(value, cls=VanillaJSONEncoder),
+               json.loads)
+
+
+class VanillaJSONProvider(DefaultJSONProvider):
+    """Serializes responses with VanillaJSONEncoder (Flask >= 2.2 ignores
+    `json_encoder` of the app class)"""
+
+    def dumps(self, obj, **kwargs):
+        kwargs.setdefault('cls', VanillaJSONEncoder)
+        # keeps VanillaJSONEncoder.default instead of the provider's
+        kwargs.setdefault('default', None)
+        return super().dumps(obj, **kwargs)
+
+
 class FlaskVanilla(Flask):
-    json_encoder = VanillaJSONEncoder
+    json_encoder = VanillaJSONEncoder  # Flask < 2.2
+    json_provider_class = VanillaJSONProvider
 
     def __init__(self, import_name, user_extension=None, tenant_extension=None,
                  user_action_tracking=True, user_mode=UserMode.SIMPLE,
@@ -102,9 +240,7 @@ class FlaskVanilla(Flask):
         )
 
         self._default_configs(logging=default_logging)
-        from column_utils import VanillaColumn, VanillaRelationshipProperty
-        db.relationship = VanillaRelationshipProperty
-        db.Column = VanillaColumn
+        cache.init_app(self)
         db.init_app(self)
         self.db = db
         self.models = []
@@ -116,8 +252,9 @@ class FlaskVanilla(Flask):
         user_extension = user_extension or EmptyExtension
         tenant_extension = tenant_extension or EmptyExtension
 
-        from api import SuperAdminAPI, TenantAdminAPI, init_error_handlers, ModelAPI  # noqa
-        from model import TenantUser, UserBase, TenantBase  # noqa
+        from .api import SuperAdminAPI, TenantAdminAPI, init_error_handlers, ModelAPI  # noqa
+        from .instrumentation import init_sql_instrumentation
+        from .model import TenantUser, UserBase, TenantBase  # noqa
 
         if user_mode == UserMode.MULTI_TENANT:
             class User(user_extension, TenantUser, db.Model):
@@ -141,18 +278,24 @@ class FlaskVanilla(Flask):
         self.init_api()
 
         init_error_handlers(self)
+        init_sql_instrumentation(self)
 
         self.user_action_handlers = []
+        self.user_action_writer = None
+        self.query_pattern_recorder = None
+        self.async_db = None  # created by AsyncModelAPI
+        from .replicas import ReplicaPool
+        self.replica_pool = ReplicaPool(self)
 
         if user_action_tracking:
             self.init_user_modifications_tracking()
 
     def add_model_rest_api(self, model):
-        from api import ModelAPI
+        from .api import ModelAPI
         ModelAPI(model, self.db).register(self)
 
     def init_api(self):
-        from api import ModelAPI
+        from .api import ModelAPI
         global MODELS
         for model in MODELS:
             ModelAPI(model, db, self)
@@ -163,11 +306,23 @@ class FlaskVanilla(Flask):
         for f in self.user_action_handlers:
             f(obj, action)
 
+    def record_user_action(self, obj, action, session=None):
+        """Write audit row for the action, should be called before commit"""
+        if self.user_action_writer:
+            self.user_action_writer.record(obj, action, session=session)
+
+    def record_user_actions(self, objs, action, session=None):
+        """Audit rows of a bulk action written with one INSERT, should be
+        called before commit"""
+        if self.user_action_writer:
+            self.user_action_writer.record_many(objs, action,
+                                                session=session)
+
     def user_action_handler(self, f):
         self.user_action_handlers.append(f)
 
     def init_user_modifications_tracking(self):
-        from api import init_user_modifications_tracking
+        from .api import init_user_modifications_tracking
         init_user_modifications_tracking(self)
 
     def entity_event(self, model, action):
@@ -181,10 +336,39 @@ class FlaskVanilla(Flask):
 
         return wrapper
 
+    def record_query_patterns(self, path=None):
+        """Record get_list filter/sort patterns for `flask vanilla
+        index-advisor`"""
+        from .index_advisor import QueryPatternRecorder
+        path = path or self.config['QUERY_PATTERNS_FILE']
+        self.query_pattern_recorder = QueryPatternRecorder(path)
+
     def _default_configs(self, logging=False):
         self.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{self.name}.db'
         self.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = True
-        self.config['CACHE_TYPE'] = 'simple'
+        self.config['CACHE_TYPE'] = 'SimpleCache'
+        self.config['CACHE_THRESHOLD'] = 10000
+        self.config['JSON_CODEC'] = 'auto'  # orjson, ujson or json
+        self.config['QUERY_PATTERNS_FILE'] = f'{self.name}.query-patterns'
+        self.config['INCLUDE_MAX_DEPTH'] = 2
+        self.config['SQL_INSTRUMENTATION'] = True
+        self.config['SQL_DEBUG_HEADERS'] = None  # app.debug
+        self.config['SQL_QUERY_WARNING_THRESHOLD'] = 50
+        self.config['SQL_REPEATED_QUERY_LIMIT'] = None
+        # AsyncModelAPI, derived from SQLALCHEMY_DATABASE_URI if not set
+        self.config['SQLALCHEMY_ASYNC_DATABASE_URI'] = None
+        self.config['SQLALCHEMY_ASYNC_ENGINE_OPTIONS'] = {}
+        # reads of ModelAPI (get, list, is-unique), see replicas.ReplicaPool
+        self.config['SQLALCHEMY_REPLICA_URIS'] = []
+        self.config['SQLALCHEMY_REPLICA_ENGINE_OPTIONS'] = {}
+        self.config['SQLALCHEMY_REPLICA_SELECTION'] = 'round-robin'
+        self.config['SQLALCHEMY_REPLICA_STICKY_SECONDS'] = 5
+        self.config['SQLALCHEMY_REPLICA_RETRY_SECONDS'] = 30
+        self.config['USER_ACTION_TRACKING_MODE'] = 'transaction'
+        self.config['USER_ACTION_BATCH_SIZE'] = 500
+        self.config['USER_ACTION_FLUSH_INTERVAL'] = 1.0
+        self.config['USER_ACTION_QUEUE_SIZE'] = 10000
+        self.config['USER_ACTION_QUEUE_OVERFLOW'] = 'block'
         if logging:
             _init__default_logging_config(self)
 
@@ -193,7 +377,7 @@ MODELS = []
 
 
 def setup_cli(app):
-    from model import DefaultRoles, Role
+    from .model import DefaultRoles, Role
     @app.cli.command()
     def init_default_data():
         with current_app.app_context():
@@ -202,8 +386,41 @@ def setup_cli(app):
                     app.db.session.add(role)
             app.db.session.commit()
 
+    vanilla = AppGroup('vanilla')
+
+    @vanilla.command('index-advisor')
+    @click.option('--patterns', default=None,
+                  help='Recorded patterns file, QUERY_PATTERNS_FILE config '
+                       'by default')
+    @click.option('--ddl', is_flag=True, help='Print only CREATE INDEX')
+    def index_advisor(patterns, ddl):
+        """Suggest indexes for recorded get_list filter/sort patterns"""
+        from .index_advisor import load_patterns, advise
+        path = patterns or app.config['QUERY_PATTERNS_FILE']
+        with current_app.app_context():
+            results = advise(app.db, load_patterns(path))
+        for (table, equality, ranges, sort), plan, statement in results:
+            if ddl:
+                if statement:
+                    click.echo(statement)
+                continue
+            click.echo(f'{table}: equality={",".join(equality)} '
+                       f'ranges={",".join(ranges)} sort={sort or ""}')
+            for line in plan:
+                click.echo(f'    {line}')
+            click.echo(f'    {statement or "covered by existing index"}')
+
+    app.cli.add_command(vanilla)
+
 
 def generate_api(model_class):
     global MODELS
     MODELS.append(model_class)
     return model_class
+
+
+from .model import (BaseModel, BaseEntity, BaseMultiTenantEntity,  # noqa
+                    UniqueNameEntity, UniqueNameTenantEntity, VersionMixin,
+                    AccessType, DefaultRoles, Permission, Role)
+from .api import ModelAPI, route  # noqa
+from .testing import BaseCRUDTestCaseMixin  # noqa
@@ -1,12 +1,31 @@
-from model import Role
+from .model import Role
 from datetime import datetime, date
-from sqlalchemy.orm import class_mapper, ColumnProperty
+from sqlalchemy.orm import (class_mapper, ColumnProperty, load_only, defer,
+                            make_transient_to_detached)
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy import and_, or_, func, inspect, text
+import base64
+import hashlib
+from math import ceil
 import json
-from flask import jsonify, request, g, abort, current_app
-from model import Permission, BaseEntity
-from validation import ModelValidationError
-from . import db
+from flask import (jsonify, request, g, abort, current_app, Response,
+                   stream_with_context)
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+from .model import Permission, BaseEntity, verify_relationships
+from .validation import ModelValidationError
+from . import db, VanillaJSONEncoder
+from .audit import UserActionWriter
+from .caching import ResponseCache, table_version
+from .uniqueness import UniqueNegativeCache
+from .replicas import ReplicaSelection, read_from_replica
+from .filters import FilterCompiler, coerce_value, parse_bool
+from .index_advisor import EQUALITY_OPERATORS, RANGE_OPERATORS
+from .includes import include_plan
+from .counting import (CountStrategy, exact_count, cached_count,
+                       estimated_count)
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
 
 
 def route(path, **options):
@@ -45,24 +64,76 @@ class ModelAPI(BaseAPI):
         DELETE_LIST = 6
         SOFT_DELETE = 7
         GET_DELETED = 8
+        BULK_CREATE = 9
+        BULK_UPDATE = 10
         DEFAULT_ALL = [CREATE, UPDATE, SOFT_DELETE, GET, GET_LIST, DELETE_LIST,
-                       DELETE]
+                       DELETE, BULK_CREATE, BULK_UPDATE]
+
+    class BulkMode:
+        ATOMIC = 'atomic'  # nothing is saved if any item fails
+        BEST_EFFORT = 'best-effort'  # valid items are saved
+
+    # get_list params which are not filters
+    list_params = frozenset(('page', 'limit', 'sort_by', 'decs',
+                             'with-deleted', 'include', 'fields', 'after',
+                             'stream'))
 
     def check_permission(self, obj, action):
         obj.check_permission(action)
 
     def __init__(self, model_class, db=None, app=None, methods=(),
-                 max_results=100, name=None, prefix=''):
+                 max_results=100, name=None, prefix='', max_bulk_size=10000,
+                 bulk_chunk_size=500, max_stream_results=10000,
+                 stream_chunk_size=500, list_deferred=None,
+                 cache_timeout=None, strict_filters=True,
+                 count_strategy=CountStrategy.EXACT, count_cache_timeout=30,
+                 count_estimate_cap=10000, unique_negative_cache=False,
+                 read_replicas=True, replica_selection=None):
         self.model = model_class
         self.name = name or self.model.__tablename__
         self.full_prefix = prefix + self.name
         self.max_results = max_results
+        self.max_bulk_size = max_bulk_size
+        self.bulk_chunk_size = bulk_chunk_size
+        self.max_stream_results = max_stream_results
+        self.stream_chunk_size = stream_chunk_size
         self.fields = [
             prop.key for prop in
             class_mapper(self.model).iterate_properties
             if isinstance(prop, ColumnProperty)
         ]
+        # private fields can not be filtered or sorted by
+        self.public_fields = [
+            field for field in self.fields
+            if not getattr(getattr(self.model, field).property.columns[0],
+                           'is_private', False)]
+        # not loaded by list endpoints unless requested with `fields`
+        self.list_deferred = list_deferred if list_deferred is not None else [
+            col.key for col in self.model.__table__.columns
+            if getattr(col, 'is_heavy', False)]
+        self.filter_compiler = FilterCompiler(self.model, self.public_fields)
+        # how total count of paginated list is calculated, see CountStrategy
+        if count_strategy not in CountStrategy.ALL:
+            raise ValueError(f'Unknown count strategy: {count_strategy}')
+        self.count_strategy = count_strategy
+        self.count_cache_timeout = count_cache_timeout
+        self.count_estimate_cap = count_estimate_cap
+        # unsupported filters are rejected, otherwise ignored
+        self.strict_filters = strict_filters
         self.methods = methods or ModelAPI.Methods.DEFAULT_ALL
+        # GET responses are cached if timeout (seconds) is specified
+        self.response_cache = ResponseCache(self, cache_timeout) \
+            if cache_timeout else None
+        # is-unique answers "free" from a bloom filter of used values
+        self.unique_cache = UniqueNegativeCache(self.model) \
+            if unique_negative_cache else None
+        # get, list and is-unique read from SQLALCHEMY_REPLICA_URIS if any,
+        # `replica_selection` overrides SQLALCHEMY_REPLICA_SELECTION
+        if replica_selection and \
+                replica_selection not in ReplicaSelection.ALL:
+            raise ValueError(f'Unknown replica selection: {replica_selection}')
+        self.read_replicas = read_replicas
+        self.replica_selection = replica_selection
 
         if app:
             self.app = app
@@ -75,9 +146,110 @@ class ModelAPI(BaseAPI):
         self.register(app)
 
     def get(self, id):
-        obj = self.model.query.get_or_404(id)
+        fields = self._requested_fields()
+        if fields or request.args.get('include'):
+            query = self._with_includes(self.model.query)
+            if fields:
+                query = self._load_fields(query,
+                                          fields | self._version_fields)
+            obj = query.filter(self.model.id == id).first_or_404()
+        else:
+            obj = self.model.query.get_or_404(id)
         self.check_permission(obj, Permission.READ)
-        return jsonify(obj.to_api())
+        etag = self._object_etag(obj)
+        if etag and request.if_none_match.contains(etag):
+            return self._not_modified(etag)
+        response = jsonify(self._to_api(obj, fields))
+        return self._with_etag(response, etag)
+
+    @property
+    def _version_fields(self):
+        return frozenset(field for field in ('updated_at', 'version_id')
+                         if field in self.fields)
+
+    def _etag(self, *parts):
+        """ETag of a list, depends on the user and query args"""
+        user = g.user
+        return _digest((self.name, getattr(user, 'id', None),
+                        sorted(request.args.items(multi=True))) + parts)
+
+    def _object_etag(self, obj):
+        """Strong ETag from version_id/updated_at, None if object has no
+        versions or included relations are requested (they have own
+        versions) - in this case ETag is a hash of the response.
+        Same for any query args, so an ETag of GET ?fields=... matches
+        If-Match of PUT."""
+        if not self._version_fields or request.args.get('include'):
+            return None
+        return _digest((self.name, obj.id, *[
+            getattr(obj, field) for field in sorted(self._version_fields)]))
+
+    def _list_etag(self, query):
+        """ETag of a list from max(updated_at) and count of the query.
+        Count is only computed for the exact count strategy, otherwise
+        the version of the table stands for it (bumped by deletes too)."""
+        if 'updated_at' not in self.fields or request.args.get('include'):
+            return None
+        values = query.order_by(None).with_entities(
+            *self._list_etag_columns()).one()
+        return self._list_etag_from(values)
+
+    def _list_etag_columns(self):
+        columns = [func.max(self.model.updated_at)]
+        if self.count_strategy == CountStrategy.EXACT:
+            columns.append(func.count(self.model.id))
+        return columns
+
+    def _list_etag_from(self, values):
+        if self.count_strategy != CountStrategy.EXACT:
+            values = (*values, table_version(self.model.__tablename__))
+        return self._etag(*values)
+
+    def _not_modified(self, etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    def _with_etag(self, response, etag):
+        if etag:
+            response.set_etag(etag)
+        else:
+            response.add_etag()
+        return response.make_conditional(request)
+
+    def _requested_fields(self):
+        """Fields from `fields=id,name` param, None if not specified"""
+        fields = request.args.get('fields')
+        if not fields:
+            return None
+        fields = frozenset(fields.split(','))
+        unknown = fields - set(self.model.__serializer__.keys)
+        if unknown:
+            abort(400, f'No such fields: {",".join(sorted(unknown))}')
+        return fields
+
+    def _load_fields(self, query, fields, deferred=()):
+        """Load only requested fields, or all except `deferred`"""
+        if fields:
+            return query.options(load_only(
+                *[getattr(self.model, field) for field in fields]))
+        if deferred:
+            return query.options(
+                *[defer(getattr(self.model, field)) for field in deferred])
+        return query
+
+    def _to_api(self, obj, fields=None):
+        data = obj.to_api()
+        if fields:
+            includes = include_plan(self.model).keys
+            data = {k: v for k, v in data.items()
+                    if k in fields or k in includes}
+        return data
+
+    def _with_includes(self, query):
+        if not request.args.get('include'):
+            return query
+        return query.options(*include_plan(self.model).options())
 
     def query_access_filter(self, query):
         """override this to add custom query filter"""
@@ -86,55 +258,235 @@ class ModelAPI(BaseAPI):
     def get_list(self):
         filters = request.args
         page = filters.get('page', type=int)
-        per_page = filters.get('limit', type=int)
+        per_page = self._limit()
+        fields = self._requested_fields()
+        query = self._list_query(filters)
+
+        if self._is_stream_requested():
+            query = self._load_fields(self._order_list_query(query), fields,
+                                      deferred=self.list_deferred)
+            return self._stream_list(query, per_page, fields)
+
+        etag = self._list_etag(query)
+        if etag and request.if_none_match.contains(etag):
+            return self._not_modified(etag)
+        query = self._load_fields(query, fields, deferred=self.list_deferred)
+
+        if 'after' in filters:
+            response = self._get_list_after(
+                query, filters.get('after'), per_page or self.max_results,
+                fields)
+            return self._with_etag(response, etag)
+
+        query = self._order_list_query(query)
+
+        if page:
+            response = jsonify(self._get_page(query, page, per_page or 20,
+                                              fields))
+            return self._with_etag(response, etag)
+
+        response = jsonify([self._to_api(obj, fields) for obj in
+                            query.limit(self.max_results).all()])
+        return self._with_etag(response, etag)
+
+    def _limit(self):
+        """`limit` param, None if not specified. Streamed lists are limited
+        by max_stream_results, others by max_results."""
+        if 'limit' not in request.args:
+            return None
+        limit = request.args.get('limit', type=int)
+        if limit is None or limit < 1:
+            abort(400, 'Limit should be a positive integer')
+        if limit > self.max_results and not self._is_stream_requested():
+            abort(400, f'Max limit is {self.max_results}')
+        return limit
+
+    def _get_page(self, query, page, per_page, fields=None):
+        if page < 1:
+            abort(404)
+        items = query.limit(per_page + 1).offset((page - 1) * per_page).all()
+        result = {
+            'items': [self._to_api(obj, fields) for obj in items[:per_page]],
+            'has_more': len(items) > per_page,
+            'count_strategy': self.count_strategy,
+        }
+        if self.count_strategy == CountStrategy.NONE:
+            return result
+        if self.count_strategy == CountStrategy.CACHED:
+            count = cached_count(
+                query, self.model, self.list_params, self.count_cache_timeout,
+                self._with_deleted_requested(request.args), self.name)
+        elif self.count_strategy == CountStrategy.ESTIMATED:
+            count = estimated_count(query, self.model,
+                                    self.count_estimate_cap)
+        else:
+            count = exact_count(query)
+        result['count'] = count
+        result['pages'] = int(ceil(count / float(per_page)))
+        return result
+
+    def _is_stream_requested(self):
+        stream = request.args.get('stream', default=False, type=parse_bool)
+        return stream or request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+    def _stream_list(self, query, limit=None, fields=None):
+        """Serialize objects while they are fetched from DB.
+        Responds with NDJSON if it is accepted, otherwise with JSON array"""
+        # `limit` can not lift max_stream_results, None means no limit
+        if self.max_stream_results:
+            limit = min(limit or self.max_stream_results,
+                        self.max_stream_results)
+        if limit:
+            query = query.limit(limit)
+        query = query.yield_per(self.stream_chunk_size)
+        ndjson = request.accept_mimetypes.best == NDJSON_MIMETYPE
+        encoder = VanillaJSONEncoder()
+
+        def generate():
+            if not ndjson:
+                yield '['
+            chunk, count = [], 0
+            for obj in query:
+                item = encoder.encode(self._to_api(obj, fields))
+                if ndjson:
+                    chunk.append(item + '\n')
+                else:
+                    chunk.append(item if not count else ',' + item)
+                count += 1
+                if len(chunk) >= self.stream_chunk_size:
+                    yield ''.join(chunk)
+                    chunk = []
+            if chunk:
+                yield ''.join(chunk)
+            if not ndjson:
+                yield ']'
+
+        return Response(stream_with_context(generate()),
+                        mimetype=NDJSON_MIMETYPE if ndjson
+                        else 'application/json')
+
+    def _list_query(self, filters):
+        query = self.model.query.with_access_check(
+            with_deleted=self._with_deleted_requested(filters))
+        return self._with_includes(self._filter_list_query(query, filters))
+
+    def _with_deleted_requested(self, filters):
+        with_deleted = filters.get('with-deleted', default=False,
+                                   type=parse_bool)
+        return with_deleted and g.user.has_permission(
+            Permission.READ_DELETED, self.model)
+
+    def _filter_list_query(self, query, filters):
+        """Filters of get_list params, `query` is a Query or a select()"""
+        for name in filters:
+            if name in self.list_params:
+                continue
+            if not self.strict_filters and name not in self.filter_compiler \
+                    and '|' not in name:
+                continue
+            query = query.filter(
+                self.filter_compiler.predicate(name, filters.getlist(name)))
+
+        recorder = getattr(current_app, 'query_pattern_recorder', None)
+        if recorder:
+            self._record_query_pattern(recorder, filters)
+
+        return self.query_access_filter(query)
+
+    def _record_query_pattern(self, recorder, filters):
+        equality, ranges = [], []
+        for name in filters:
+            described = self.filter_compiler.describe(name)
+            if not described:
+                continue
+            field, operator = described
+            if operator in EQUALITY_OPERATORS:
+                equality.append(field)
+            elif operator in RANGE_OPERATORS:
+                ranges.append(field)
         sort_by = filters.get('sort_by')
-        decs = filters.get('decs', default=False, type=bool)
-        with_deleted = request.args.get('with-deleted', type=bool,
-                                        default=False)
-        query = self.model.query.with_access_check()
-
-        if with_deleted and g.user.has_permission(Permission.READ_DELETED,
-                                                  self.model):
-            query = query.with_deleted()
-
-        for name, value in filters.items():
-            if name.endswith('-min'):
-                field_name = name.split('-min')[0]
-                if field_name in self.fields:
-                    query = query.filter(
-                        getattr(self.model, field_name) >= value)
-            elif name.endswith('-max'):
-                field_name = name.split('-max')[0]
-                if field_name in self.fields:
-                    query = query.filter(
-                        getattr(self.model, field_name) <= value)
-            elif name.endswith('-like'):
-                field_name = name.split('-like')[0]
-                if field_name in self.fields:
-                    query = query.filter(
-                        getattr(self.model, field_name).like(value))
+        recorder.record(self.model.__table__.name, equality, ranges,
+                        sort_by if sort_by in self.public_fields else None)
+
+    def _sort_column(self):
+        sort_by = request.args.get('sort_by')
+        if not sort_by:
+            return None
+        if sort_by not in self.public_fields:
+            abort(400, f'Cannot sort by: {sort_by}')
+        return getattr(self.model, sort_by)
+
+    def _order_list_query(self, query):
+        column = self._sort_column()
+        decs = request.args.get('decs', default=False, type=parse_bool)
+        if column is not None:
+            query = query.order_by(column.desc() if decs else column.asc())
+        return query
+
+    def _get_list_after(self, query, cursor, limit, fields=None):
+        """Keyset pagination: `after` is an opaque token returned as `next`
+        by the previous page, empty `after` starts from the beginning."""
+        column = self._sort_column()
+        decs = request.args.get('decs', default=False, type=parse_bool)
+        id_column = self.model.id
+
+        if cursor:
+            values = _decode_cursor(
+                cursor, None if column is None else column.key)
+            if column is not None:
+                _, last_value, last_id = values
+                query = query.filter(self._after_criteria(
+                    column, last_value, last_id, decs))
             else:
-                if name in self.fields:
-                    query = query.filter(getattr(self.model, name) == value)
+                last_id, = values
+                query = query.filter(
+                    id_column < last_id if decs else id_column > last_id)
 
-        query = self.query_access_filter(query)
+        order = []
+        if column is not None:
+            # nulls sort as the smallest value whatever the database default
+            order.append(column.desc().nullslast() if decs
+                         else column.asc().nullsfirst())
+        order.append(id_column.desc() if decs else id_column.asc())
+        items = query.order_by(*order).limit(limit + 1).all()
 
-        if sort_by:
-            query = query.order_by(sort_by + ' desc' if decs else '')
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            last = items[-1]
+            next_cursor = _encode_cursor(
+                [last.id] if column is None else
+                [column.key, getattr(last, column.key), last.id])
 
-        if page:
-            query = query.paginate(page=page, per_page=per_page)
-            return jsonify(
-                {'items': [obj.to_api() for obj in query.items],
-                 'pages': query.pages})
+        return jsonify({'items': [self._to_api(obj, fields) for obj in items],
+                        'next': next_cursor})
 
-        return jsonify(
-            [obj.to_api() for obj in query.limit(self.max_results).all()])
+    def _after_criteria(self, column, last_value, last_id, decs):
+        """Rows following (`last_value`, `last_id`) in the order of
+        `_get_list_after`, where nulls come first on ascending sort"""
+        id_column = self.model.id
+        if last_value is None:
+            after_id = id_column < last_id if decs else id_column > last_id
+            if decs:
+                return and_(column.is_(None), after_id)
+            return or_(column.isnot(None),
+                       and_(column.is_(None), after_id))
+        try:
+            last_value = coerce_value(column.type.python_type, last_value)
+        except (ValueError, TypeError, NotImplementedError):
+            abort(400, 'Invalid cursor')
+        if decs:
+            return or_(column < last_value,
+                       and_(column == last_value, id_column < last_id),
+                       column.is_(None))
+        return or_(column > last_value,
+                   and_(column == last_value, id_column > last_id))
 
     def delete(self, id):
         obj = self.model.query.get_or_404(id)
         self.check_permission(obj, Permission.WRITE)
         obj.soft_delete(self.db.session)
+        self.app.record_user_action(obj, 'deleted')
         self.db.session.commit()
         self.app.log_user_action(obj, 'deleted')
         return 'DELETED'
@@ -145,24 +497,48 @@ class ModelAPI(BaseAPI):
             abort(404)
         self.check_permission(obj, Permission.HARD_WRITE)
         db.session.delete(obj)
+        self.app.record_user_action(obj, 'deleted')
         self.db.session.commit()
         self.app.log_user_action(obj, 'deleted')
         return 'DELETED'
 
     def delete_all(self):
+        """Delete objects from `id_list` with set-based queries.
+        ?soft=true marks objects as deleted instead of removing them.
+        Ids the user has no permission for are skipped, returns the list of
+        actually deleted ids."""
+        id_list = (request.json or {}).get('id_list', [])
+        if not isinstance(id_list, list):
+            abort(400, 'List of ids expected')
+        soft = request.args.get('soft', default=False, type=parse_bool)
+        action = Permission.WRITE if soft else Permission.HARD_WRITE
+        session = self.db.session
         deleted = []
-        for obj_id in request.json.get('id_list', []):
-            try:
-                obj = db.session.query(self.model).get(id)
-                if not obj:
-                    continue
-                self.check_permission(obj, Permission.HARD_WRITE)
-                db.session.delete(obj)
-                db.session.commit()
-                deleted.append(obj_id)
-            except Exception as e:
-                self.app.logger.exeption(f'Failed to delete obj, id: {obj_id}')
-        return json.dumps(deleted)
+        for start in range(0, len(id_list), self.bulk_chunk_size):
+            chunk = id_list[start:start + self.bulk_chunk_size]
+            query = self.model.query.with_access_check(
+                with_deleted=not soft).filter(self.model.id.in_(chunk))
+            query = self.model.permission_filter(
+                self.query_access_filter(query), action)
+            ids = [obj_id for obj_id, in query.with_entities(self.model.id)]
+            if not ids:
+                continue
+            self.pre_delete_all(ids)
+            target = session.query(self.model).filter(
+                self.model.id.in_(ids))
+            if soft:
+                target.update({self.model.deleted: True,
+                               self.model.deleted_at: datetime.now()},
+                              synchronize_session=False)
+            else:
+                target.delete(synchronize_session=False)
+            message = f'{"soft " if soft else ""}deleted: {ids}'
+            self.app.record_user_action(self.model, message)
+            session.commit()
+            self.post_delete_all(ids)
+            self.app.log_user_action(self.model, message)
+            deleted.extend(ids)
+        return jsonify(deleted)
 
     def restore(self, id):
         obj = self.model.query.get_with_deleted(id)
@@ -172,6 +548,7 @@ class ModelAPI(BaseAPI):
         self.pre_restore(obj)
         obj.deleted = False
         self.db.session.add(obj)
+        self.app.record_user_action(obj, 'restored')
         self.db.session.commit()
         self.post_restore(obj)
         self.app.log_user_action(obj, 'restored')
@@ -185,18 +562,347 @@ class ModelAPI(BaseAPI):
         self.pre_create(obj)
         obj.validate_on_create()  # needed only for create
         self.db.session.add(obj)
+        self.app.record_user_action(obj, 'created')
         self.db.session.commit()
         self.post_create(obj)
         self.app.log_user_action(obj, 'created')
         return jsonify(obj.to_api())
 
+    def bulk_create(self):
+        """Create a list of objects in one transaction.
+        ?mode=atomic (default) - nothing is saved if any item is invalid,
+        ?mode=best-effort - valid items are saved, errors are returned
+        per item."""
+        mode = self._bulk_mode()
+        items = json.loads(request.data)
+        if not isinstance(items, list):
+            abort(400, 'List of objects expected')
+        self._check_bulk_size(len(items))
+
+        # all items are checked in one pass before any object is built
+        cleaned, errors = self.model.__validator__.clean_many(items)
+        cleaned = self._check_unique_many(cleaned, errors)
+        if errors and mode == ModelAPI.BulkMode.ATOMIC:
+            return json.dumps({'errors': errors}), 422
+
+        objects = []
+        for index, data in cleaned:
+            try:
+                obj = self.model()
+                obj.populate_from_data(data, cleaned=True)
+                self.check_permission(obj, Permission.WRITE)
+                self.pre_create(obj)
+                obj.validate_on_create(verify_relationships=False)
+                objects.append((index, obj))
+            except ModelValidationError as e:
+                errors[index] = e.errors
+            except ValueError as e:
+                errors[index] = {'': str(e)}
+            except HTTPException:
+                errors[index] = {'': 'Permission denied'}
+
+        # references of all objects, one query per related model
+        verified = verify_relationships([obj for _, obj in objects],
+                                        self.bulk_chunk_size)
+        for (index, _), obj_errors in zip(objects, verified):
+            if obj_errors:
+                errors[index] = obj_errors
+        objects = [item for item in objects if item[0] not in errors]
+
+        if errors and mode == ModelAPI.BulkMode.ATOMIC:
+            self.db.session.rollback()
+            return json.dumps({'errors': errors}), 422
+
+        created = self._insert_chunks(
+            objects, errors, atomic=mode == ModelAPI.BulkMode.ATOMIC)
+        self._record_bulk_actions(created, 'created')
+        self.db.session.commit()
+        self._load_expired(created)
+
+        for obj in created:
+            self.post_create(obj)
+            self.app.log_user_action(obj, 'created')
+
+        return self._bulk_response(len(items), objects, errors)
+
+    def bulk_update(self):
+        """Partial update of many objects in one transaction.
+        Data is either a list of objects with ids: [{"id": 1, ...}, ...],
+        or a filter (same params as for get_list) with fields to set:
+        {"filter": {"access": "public"}, "set": {"access": "private"}}.
+        Modes are the same as for bulk_create."""
+        mode = self._bulk_mode()
+        data = json.loads(request.data)
+        validator = self.model.__validator__
+        errors = {}
+        if isinstance(data, list):
+            self._check_bulk_size(len(data))
+            changes = []
+            for index, item in enumerate(data):
+                if not isinstance(item, dict) or 'id' not in item:
+                    errors[index] = {'id': 'Should be specified'}
+                    continue
+                if not isinstance(item['id'], int) or \
+                        isinstance(item['id'], bool):
+                    errors[index] = {'id': 'Should be an integer'}
+                    continue
+                changes.append((index, item))
+            cleaned, invalid = validator.clean_many(
+                [item for _, item in changes], saved=True)
+            errors.update((changes[i][0], e) for i, e in invalid.items())
+            found = self._load_by_ids([item['id'] for _, item in changes])
+            targets = []
+            for i, values in cleaned:
+                index, item = changes[i]
+                obj = found.get(item['id'])
+                if obj is None:
+                    errors[index] = {
+                        'id': f'{item["id"]} : object with such id not found'}
+                else:
+                    targets.append((index, obj, values))
+        elif isinstance(data, dict) and 'filter' in data and 'set' in data:
+            if not data['filter'] or not isinstance(data['filter'], dict):
+                abort(400, 'Filter should be specified')
+            if not isinstance(data['set'], dict):
+                abort(400, 'Fields to set should be an object')
+            # validated once for all objects
+            values = validator.clean(data['set'], saved=True)
+            query = self._list_query(MultiDict(data['filter']))
+            objs = query.limit(self.max_bulk_size + 1).all()
+            self._check_bulk_size(len(objs))
+            targets = [(index, obj, values)
+                       for index, obj in enumerate(objs)]
+        else:
+            abort(400, 'List of objects or filter and set expected')
+
+        if errors and mode == ModelAPI.BulkMode.ATOMIC:
+            return json.dumps({'errors': errors}), 422
+
+        atomic = mode == ModelAPI.BulkMode.ATOMIC
+        session = self.db.session
+        objects = []
+        for index, obj, item in targets:
+            try:
+                if atomic:
+                    self._apply_update(obj, item)
+                else:
+                    with session.begin_nested():
+                        self._apply_update(obj, item)
+                objects.append((index, obj))
+            except ModelValidationError as e:
+                errors[index] = e.errors
+            except ValueError as e:
+                errors[index] = {'': str(e)}
+            except IntegrityError:
+                errors[index] = {'': 'Invalid entity'}
+            except HTTPException:
+                errors[index] = {'': 'Permission denied'}
+
+            if atomic and errors:
+                session.rollback()
+                return json.dumps({'errors': errors}), 422
+            if atomic and len(objects) % self.bulk_chunk_size == 0:
+                session.flush()
+
+        self._record_bulk_actions([obj for _, obj in objects], 'updated')
+        session.commit()
+        self._load_expired([obj for _, obj in objects])
+
+        for _, obj in objects:
+            self.post_update(obj)
+            self.app.log_user_action(obj, 'updated')
+
+        return self._bulk_response(
+            len(data) if isinstance(data, list) else len(targets),
+            objects, errors)
+
+    def _check_unique_many(self, cleaned, errors):
+        """Unique fields of all items are checked with one query per field
+        instead of a query per item, duplicates inside the payload are
+        rejected too. Returns items without errors."""
+        for field in self.model.unique_fields:
+            values = [data[field] for _, data in cleaned
+                      if data.get(field) is not None]
+            if not values:
+                continue
+            taken = self.model.taken_values(field, values,
+                                            self.bulk_chunk_size)
+            seen = set()
+            for index, data in cleaned:
+                value = data.get(field)
+                if value is None:
+                    continue
+                if value in taken or value in seen:
+                    errors[index] = {field: 'Already taken'}
+                seen.add(value)
+        return [(index, data) for index, data in cleaned
+                if index not in errors]
+
+    def _apply_update(self, obj, data):
+        self.check_permission(obj, Permission.WRITE)
+        self.pre_update(obj)
+        obj.populate_from_data(data, cleaned=True)
+        obj.validate()
+        self.db.session.add(obj)
+
+    def _load_by_ids(self, ids):
+        """Load objects (with access check) by chunked IN queries"""
+        found = {}
+        ids = list(set(ids))
+        for start in range(0, len(ids), self.bulk_chunk_size):
+            chunk = ids[start:start + self.bulk_chunk_size]
+            query = self.query_access_filter(
+                self.model.query.with_access_check().filter(
+                    self.model.id.in_(chunk)))
+            found.update((obj.id, obj) for obj in query.all())
+        return found
+
+    def _bulk_mode(self):
+        mode = request.args.get('mode', ModelAPI.BulkMode.ATOMIC)
+        if mode not in (ModelAPI.BulkMode.ATOMIC,
+                        ModelAPI.BulkMode.BEST_EFFORT):
+            abort(400, f'Unknown mode: {mode}')
+        return mode
+
+    def _check_bulk_size(self, size):
+        if size > self.max_bulk_size:
+            abort(400, f'Max bulk size is {self.max_bulk_size}')
+
+    def _record_bulk_actions(self, objs, action):
+        for start in range(0, len(objs), self.bulk_chunk_size):
+            self.app.record_user_actions(
+                objs[start:start + self.bulk_chunk_size], action)
+
+    def _load_expired(self, objs):
+        """Reload objects expired by commit with one IN query per chunk,
+        otherwise each of them is loaded by own query on first access"""
+        ids = [inspect(obj).identity[0] for obj in objs]
+        for start in range(0, len(ids), self.bulk_chunk_size):
+            self.db.session.query(self.model).filter(self.model.id.in_(
+                ids[start:start + self.bulk_chunk_size])).all()
+
+    def _bulk_response(self, count, objects, errors):
+        results = [None] * count
+        for index, obj in objects:
+            if index not in errors:
+                results[index] = {'result': obj.to_api()}
+        for index, item_errors in errors.items():
+            results[index] = {'errors': item_errors}
+        return jsonify(results)
+
+    def _insert_chunks(self, objects, errors, atomic=True):
+        """INSERT objects with one executemany per chunk.
+        In best-effort mode failed chunk is retried item by item to find
+        the rows DB has rejected, in atomic mode the error is raised."""
+        session = self.db.session
+        created = []
+        for start in range(0, len(objects), self.bulk_chunk_size):
+            chunk = objects[start:start + self.bulk_chunk_size]
+            objs = [obj for _, obj in chunk]
+            if atomic:
+                self._attach(objs, self._insert_rows(objs))
+                created.extend(objs)
+                continue
+            try:
+                with session.begin_nested():
+                    ids = self._insert_rows(objs)
+            except IntegrityError:
+                for index, obj in chunk:
+                    try:
+                        with session.begin_nested():
+                            ids = self._insert_rows([obj])
+                    except IntegrityError:
+                        errors[index] = {'': 'Invalid entity'}
+                    else:
+                        self._attach([obj], ids)
+                        created.append(obj)
+            else:
+                self._attach(objs, ids)
+                created.extend(objs)
+        return created
+
+    def _insert_rows(self, objs):
+        """INSERT of not persisted objects with one executemany per set of
+        populated columns (usually one per chunk), returns ids of the rows
+        in the order of `objs`"""
+        session = self.db.session
+        mapper = class_mapper(self.model)
+        groups = {}
+        for position, obj in enumerate(objs):
+            if obj in session:
+                session.expunge(obj)  # cascaded from a relationship
+            row = self._insert_row(mapper, obj)
+            groups.setdefault(frozenset(row), []).append((position, row))
+
+        ids = [None] * len(objs)
+        for rows in groups.values():
+            inserted = self._execute_insert(mapper, [row for _, row in rows])
+            for (position, _), id in zip(rows, inserted):
+                ids[position] = id
+        return ids
+
+    @staticmethod
+    def _insert_row(mapper, obj):
+        values = inspect(obj).dict
+        row = {}
+        for column in mapper.local_table.columns:
+            key = mapper.get_property_by_column(column).key
+            if key not in values:
+                continue
+            # as ORM does, None is skipped if the column has a default
+            if values[key] is None and (
+                    column.primary_key or column.default is not None or
+                    column.server_default is not None):
+                continue
+            row[column.key] = values[key]
+        version = mapper.version_id_col
+        if version is not None and version.key not in row and \
+                mapper.version_id_generator:
+            row[version.key] = mapper.version_id_generator(None)
+        return row
+
+    def _execute_insert(self, mapper, rows):
+        session = self.db.session
+        table = mapper.local_table
+        id_column = table.c.id
+        dialect = session.connection(
+            bind_arguments={'mapper': mapper}).dialect
+        if id_column.key in rows[0]:
+            session.execute(table.insert(), rows)
+            return [row[id_column.key] for row in rows]
+        if dialect.insert_executemany_returning:
+            return session.execute(table.insert().returning(id_column),
+                                   rows).scalars().all()
+        if dialect.name == 'sqlite':
+            session.execute(table.insert(), rows)
+            # the transaction holds the write lock, rowids of the rows are
+            # consecutive
+            last = session.execute(text('SELECT last_insert_rowid()'),
+                                   bind_arguments={'mapper': mapper}).scalar()
+            return list(range(last - len(rows) + 1, last + 1))
+        return [session.execute(table.insert(), row).inserted_primary_key[0]
+                for row in rows]
+
+    def _attach(self, objs, ids):
+        """Add inserted objects to the session as persistent, attributes
+        which were not set (defaults) are loaded on access"""
+        session = self.db.session
+        for obj, id in zip(objs, ids):
+            obj.id = id
+            make_transient_to_detached(obj)
+            session.add(obj)
+
     def update(self, id):
         obj = self.model.query.get_or_404(id)
         self.check_permission(obj, Permission.WRITE)
+        if request.if_match and not request.if_match.contains(
+                self._object_etag(obj) or ''):
+            abort(412)
         self.pre_update(obj)
         obj.populate_from_request()
         obj.validate()
         self.db.session.add(obj)
+        self.app.record_user_action(obj, 'updated')
         self.db.session.commit()
         self.post_update(obj)
         self.app.log_user_action(obj, 'updated')
@@ -232,26 +938,43 @@ class ModelAPI(BaseAPI):
     def post_restore(self, obj):
         pass
 
-    def check_if_is_unique(self, field, value):
+    def _unique_check_value(self, field, value):
+        column = self.model.__table__.columns.get(field)
+        if column is None or getattr(column, 'is_private', False):
+            abort(400, f'No such field: {field}')
         # value is a string, so it should be converted first
-        col_type = getattr(self, field).type.python_type
+        col_type = column.type.python_type
         try:
-            value = col_type(value)
-        except ValueError:
-            return 'Invalid value', 400
+            return col_type(value)
+        except (ValueError, TypeError):
+            abort(400, 'Invalid value')
+
+    def check_if_is_unique(self, field, value):
+        value = self._unique_check_value(field, value)
+        if self.unique_cache and self.unique_cache.is_free(field, value):
+            return jsonify({'result': True})
         return jsonify({'result': self.model.is_unique(field, value)})
 
     def register(self, api):
         super(ModelAPI, self).register(api, self.full_prefix)
+        get, get_list = self.get, self.get_list
+        is_unique = self.check_if_is_unique
+        if self.read_replicas:
+            get, get_list, is_unique = [
+                read_from_replica(view, self.replica_selection)
+                for view in (get, get_list, is_unique)]
+        if self.response_cache:
+            get = self.response_cache(get)
+            get_list = self.response_cache(get_list)
         if ModelAPI.Methods.GET in self.methods:
             api.add_url_rule(
                 f'/{self.full_prefix}/<int:id>', f'get_{self.name}',
-                self.get, methods=['GET']
+                get, methods=['GET']
             )
         if ModelAPI.Methods.GET_LIST in self.methods:
             api.add_url_rule(
                 f'/{self.full_prefix}/', f'get_{self.name}_list',
-                self.get_list, methods=['GET']
+                get_list, methods=['GET']
             )
         if ModelAPI.Methods.SOFT_DELETE in self.methods:
             api.add_url_rule(
@@ -264,9 +987,9 @@ class ModelAPI(BaseAPI):
                 f'hard_delete_{self.name}',
                 self.hard_delete, methods=['DELETE']
             )
-        if ModelAPI.Methods.DELETE in self.methods:
+        if ModelAPI.Methods.DELETE_LIST in self.methods:
             api.add_url_rule(
-                f'/{self.full_prefix}/<int:id>/delete-all',
+                f'/{self.full_prefix}/delete-all',
                 f'delete_all_{self.name}',
                 self.delete_all, methods=['DELETE']
             )
@@ -281,6 +1004,16 @@ class ModelAPI(BaseAPI):
                 f'/{self.full_prefix}', f'create_{self.name}',
                 self.create, methods=['POST']
             )
+        if ModelAPI.Methods.BULK_CREATE in self.methods:
+            api.add_url_rule(
+                f'/{self.full_prefix}/bulk', f'bulk_create_{self.name}',
+                self.bulk_create, methods=['POST']
+            )
+        if ModelAPI.Methods.BULK_UPDATE in self.methods:
+            api.add_url_rule(
+                f'/{self.full_prefix}/bulk', f'bulk_update_{self.name}',
+                self.bulk_update, methods=['PATCH']
+            )
         if ModelAPI.Methods.UPDATE in self.methods:
             api.add_url_rule(
                 f'/{self.full_prefix}/<int:id>', f'update_{self.name}',
@@ -289,7 +1022,7 @@ class ModelAPI(BaseAPI):
         api.add_url_rule(
             f'/{self.full_prefix}/<field>/is-unique/<value>',
             f'check_unique_{self.name}',
-            self.check_if_is_unique, methods=['GET']
+            is_unique, methods=['GET']
         )
 
 
@@ -307,6 +1040,7 @@ class TenantAdminAPI(ModelAPI):
         role = Role.query.get_or_404(role_name)
         user.roles.append(role)
         self.db.session.add(user)
+        self.app.record_user_action(user, f'role added: {role_name}')
         self.db.session.commit()
         self.app.log_user_action(user, f'role added: {role_name}')
 
@@ -320,6 +1054,7 @@ class TenantAdminAPI(ModelAPI):
             return
         user.roles.remove(role)
         self.db.session.add(user)
+        self.app.record_user_action(user, f'role removed: {role_name}')
         self.db.session.commit()
         self.app.log_user_action(user, f'role removed: {role_name}')
 
@@ -349,6 +1084,33 @@ class PermissionsAPI(SuperAdminAPI):
                                              max_results=max_results)
 
 
+def _digest(parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def _encode_cursor(values):
+    raw = json.dumps(values, cls=VanillaJSONEncoder).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_cursor(cursor, sort_by=None):
+    """Values of a cursor: [id], or [sort_by, sort value, id] if the list
+    is sorted, a cursor of other sort_by is invalid"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        abort(400, 'Invalid cursor')
+    if not isinstance(values, list) or \
+            len(values) != (1 if sort_by is None else 3) or \
+            not isinstance(values[-1], int) or \
+            isinstance(values[-1], bool):
+        abort(400, 'Invalid cursor')
+    if sort_by is not None and values[0] != sort_by:
+        abort(400, 'Invalid cursor')
+    return values
+
+
 def _get_entities():
     return [model for model in db.Model._decl_class_registry.values()
             if isinstance(model, type) and issubclass(model, BaseEntity)]
@@ -377,9 +1139,5 @@ def init_user_modifications_tracking(app):
         entity = db.Column(db.String)
         user_id = db.Column(db.Integer)
 
-    @app.user_action_handler
-    def add_action(obj, action, message=None):
-        app.db.session.add(
-            UserAction(name=action, message=message, entity=obj.__tablename__,
-                       user_id=g.user.id))
-        app.db.session.commit()
+    app.UserAction = UserAction
+    app.user_action_writer = UserActionWriter(app, UserAction)
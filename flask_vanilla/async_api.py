@@ -0,0 +1,427 @@
+import asyncio
+import json
+from math import ceil
+
+from flask import request, g, abort, jsonify
+from sqlalchemy import select, func, event, text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.pool import NullPool
+
+from . import db, cache
+from .api import ModelAPI
+from .caching import (_track_flushed_tables, _track_bulk_tables,
+                      _track_executed_tables, _invalidate_changed_tables,
+                      _discard_changed_tables)
+from .counting import CountStrategy, count_cache_key
+from .includes import include_plan, read_criteria
+from .model import (Permission, _collect_references, _reference_errors,
+                    _track_permission_changes,
+                    _track_executed_permission_changes,
+                    _invalidate_permissions, _discard_permission_changes)
+from .validation import ModelValidationError
+
+# async drivers used when SQLALCHEMY_ASYNC_DATABASE_URI is not set
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+}
+
+
+class VanillaSyncSession(Session):
+    """Session behind AsyncSession, with the listeners of db.session: cache
+    and permission invalidation (and audit, see AsyncDatabase)"""
+
+
+for _name, _listener in (
+        ('after_flush', _track_flushed_tables),
+        ('after_bulk_update', _track_bulk_tables),
+        ('after_bulk_delete', _track_bulk_tables),
+        ('do_orm_execute', _track_executed_tables),
+        ('after_commit', _invalidate_changed_tables),
+        ('after_rollback', _discard_changed_tables),
+        ('after_flush', _track_permission_changes),
+        ('do_orm_execute', _track_executed_permission_changes),
+        ('after_commit', _invalidate_permissions),
+        ('after_rollback', _discard_permission_changes)):
+    event.listen(VanillaSyncSession, _name, _listener)
+
+
+class AsyncDatabase:
+    """Async engine and sessions of the app (`app.async_db`).
+    Flask runs every async view in a new event loop, connections can not be
+    shared between loops, so they are not pooled unless `poolclass` is set
+    in SQLALCHEMY_ASYNC_ENGINE_OPTIONS."""
+
+    def __init__(self, app):
+        self.app = app
+        self._engine = None
+        self._sessionmaker = None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            config = self.app.config
+            uri = config['SQLALCHEMY_ASYNC_DATABASE_URI']
+            if not uri:
+                # resolved URL, e.g. relative SQLite path of Flask-SQLAlchemy
+                url = db.get_engine(self.app).url
+                driver = ASYNC_DRIVERS.get(url.get_backend_name())
+                if driver is None:
+                    raise ValueError(f'No async driver for {url.drivername}, '
+                                     f'set SQLALCHEMY_ASYNC_DATABASE_URI')
+                uri = url.set(drivername=driver)
+            options = dict(config['SQLALCHEMY_ASYNC_ENGINE_OPTIONS'])
+            options.setdefault('poolclass', NullPool)
+            if self.app.user_action_writer:
+                self.app.user_action_writer.listen(VanillaSyncSession)
+            self._engine = create_async_engine(uri, **options)
+            self._sessionmaker = sessionmaker(
+                self._engine, class_=AsyncSession,
+                sync_session_class=VanillaSyncSession,
+                expire_on_commit=False)
+        return self._engine
+
+    def session(self):
+        self.engine
+        return self._sessionmaker()
+
+
+def select_with_access(model, with_deleted=False):
+    """select() version of `model.query.with_access_check()`"""
+    statement = select(model)
+    if not with_deleted:
+        statement = statement.filter_by(deleted=False)
+    if request:
+        statement = model.access_filter(statement)
+    return statement
+
+
+def _single_column(node):
+    """Relation loaded by own IN query: one column, no secondary table"""
+    rel = node.relationship
+    return rel.secondary is None and len(rel.local_remote_pairs) == 1
+
+
+class AsyncModelAPI(ModelAPI):
+    """ModelAPI with async views on SQLAlchemy asyncio sessions, requires
+    Flask 2 with async extra and an async driver (aiosqlite, asyncpg,
+    aiomysql). Routes, permissions, filters and hooks are the same.
+    Independent queries of a request run concurrently, each in own session:
+    page, count and ETag of a list, included relations, referenced objects.
+    Streamed and `after` lists, bulk endpoints and delete-all use db.session.
+    """
+
+    def init_app(self, app):
+        self.app = app
+        if app.async_db is None:
+            app.async_db = AsyncDatabase(app)
+        super().init_app(app)
+
+    @property
+    def async_db(self):
+        return self.app.async_db
+
+    async def _all(self, statement):
+        async with self.async_db.session() as session:
+            return (await session.execute(statement)).scalars().all()
+
+    async def _get_or_404(self, session, id, with_deleted=False):
+        obj = await session.get(self.model, id)
+        if obj is None or (obj.deleted and not with_deleted):
+            abort(404)
+        return obj
+
+    async def get(self, id):
+        fields = self._requested_fields()
+        statement = select(self.model).filter_by(id=id, deleted=False)
+        if fields:
+            statement = self._load_fields(statement, fields | (
+                self._version_fields | self._include_keys()))
+        objs = await self._all(self._with_joined_includes(statement))
+        if not objs:
+            abort(404)
+        obj = objs[0]
+        self.check_permission(obj, Permission.READ)
+        etag = self._object_etag(obj)
+        if etag and request.if_none_match.contains(etag):
+            return self._not_modified(etag)
+        await self._load_includes(objs)
+        response = jsonify(self._to_api(obj, fields))
+        return self._with_etag(response, etag)
+
+    async def get_list(self):
+        if self._is_stream_requested() or 'after' in request.args:
+            return ModelAPI.get_list(self)
+
+        filters = request.args
+        page = filters.get('page', type=int)
+        per_page = self._limit() or 20
+        fields = self._requested_fields()
+        if page and page < 1:
+            abort(404)
+
+        statement = self._filter_list_query(
+            select_with_access(self.model,
+                               self._with_deleted_requested(filters)),
+            filters)
+        items = self._order_list_query(self._load_fields(
+            statement, fields and fields | self._include_keys(),
+            deferred=self.list_deferred))
+        items = self._with_joined_includes(items)
+        if page:
+            items = items.limit(per_page + 1).offset((page - 1) * per_page)
+        else:
+            items = items.limit(self.max_results)
+
+        queries = [self._all(items), self._list_etag_async(statement)]
+        if page and self.count_strategy != CountStrategy.NONE:
+            queries.append(self._count(statement))
+        items, etag, *count = await asyncio.gather(*queries)
+        if etag and request.if_none_match.contains(etag):
+            return self._not_modified(etag)
+
+        if not page:
+            await self._load_includes(items)
+            response = jsonify([self._to_api(obj, fields) for obj in items])
+            return self._with_etag(response, etag)
+
+        await self._load_includes(items[:per_page])
+        result = {
+            'items': [self._to_api(obj, fields) for obj in items[:per_page]],
+            'has_more': len(items) > per_page,
+            'count_strategy': self.count_strategy,
+        }
+        if count:
+            result['count'] = count[0]
+            result['pages'] = int(ceil(count[0] / float(per_page)))
+        return self._with_etag(jsonify(result), etag)
+
+    async def _list_etag_async(self, statement):
+        if 'updated_at' not in self.fields or request.args.get('include'):
+            return None
+        statement = statement.with_only_columns(*self._list_etag_columns())
+        async with self.async_db.session() as session:
+            values = (await session.execute(statement)).one()
+        return self._list_etag_from(values)
+
+    async def _count(self, statement):
+        if self.count_strategy == CountStrategy.CACHED:
+            key = count_cache_key(
+                self.model, self.list_params,
+                self._with_deleted_requested(request.args), self.name)
+            count = cache.get(key)
+            if count is None:
+                count = await self._exact_count(statement)
+                cache.set(key, count, timeout=self.count_cache_timeout)
+            return count
+        if self.count_strategy == CountStrategy.ESTIMATED:
+            return await self._estimated_count(statement)
+        return await self._exact_count(statement)
+
+    async def _exact_count(self, statement):
+        subquery = statement.subquery()
+        async with self.async_db.session() as session:
+            return await session.scalar(
+                select(func.count()).select_from(subquery))
+
+    async def _estimated_count(self, statement):
+        """Same as `counting.estimated_count`"""
+        dialect = self.async_db.engine.dialect
+        async with self.async_db.session() as session:
+            if dialect.name == 'postgresql':
+                compiled = statement.compile(
+                    dialect=dialect, compile_kwargs={'literal_binds': True})
+                plan = await session.scalar(
+                    text(f'EXPLAIN (FORMAT JSON) {compiled}'))
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                return int(plan[0]['Plan']['Plan Rows'])
+            subquery = statement.with_only_columns(self.model.id).limit(
+                self.count_estimate_cap).subquery()
+            return await session.scalar(
+                select(func.count()).select_from(subquery))
+
+    def _include_keys(self):
+        """Columns needed to load included relations by own queries"""
+        if not request.args.get('include'):
+            return frozenset()
+        return frozenset(
+            self.model.__mapper__.get_property_by_column(local).key
+            for node in include_plan(self.model).nodes
+            if _single_column(node)
+            for local, _ in node.relationship.local_remote_pairs)
+
+    def _with_joined_includes(self, statement):
+        """Relations which can not be loaded in parallel are loaded by
+        loader options of the statement"""
+        if not request.args.get('include'):
+            return statement
+        plan = include_plan(self.model)
+        return statement.options(*[
+            option for node in plan.nodes if not _single_column(node)
+            for option in plan._options(node, None)])
+
+    async def _load_includes(self, objects):
+        if not request.args.get('include') or not objects:
+            return
+        await self._load_nodes(objects, include_plan(self.model).nodes)
+
+    async def _load_nodes(self, objects, nodes):
+        await asyncio.gather(*[self._load_node(objects, node)
+                               for node in nodes if _single_column(node)])
+
+    async def _load_node(self, objects, node):
+        """One IN query for the relation of all objects"""
+        (local, remote), = node.relationship.local_remote_pairs
+        local_key = node.relationship.parent.get_property_by_column(local).key
+        remote_key = node.relationship.mapper.get_property_by_column(
+            remote).key
+        remote_attr = getattr(node.target, remote_key)
+        values = {getattr(obj, local_key) for obj in objects} - {None}
+        related = []
+        if values:
+            statement = select(node.target).filter(remote_attr.in_(values))
+            criteria = read_criteria(node.target)
+            if criteria is not None:
+                statement = statement.filter(criteria)
+            plan = include_plan(self.model)
+            statement = statement.options(*[
+                option for child in node.children
+                if not _single_column(child)
+                for option in plan._options(child, None)])
+            related = await self._all(statement)
+        grouped = {}
+        for target in related:
+            grouped.setdefault(getattr(target, remote_key), []).append(target)
+        for obj in objects:
+            targets = grouped.get(getattr(obj, local_key), [])
+            set_committed_value(obj, node.key, targets if node.uselist else
+                                (targets[0] if targets else None))
+        if related and node.children:
+            await self._load_nodes(related, node.children)
+
+    async def _is_taken(self, session, field, value):
+        # soft deleted rows are in the unique index too
+        _, criteria = self.model.unique_scope()
+        statement = select(self.model.id).filter(
+            getattr(self.model, field) == value)
+        if criteria is not None:
+            statement = statement.filter(criteria)
+        return await session.scalar(select(statement.exists()))
+
+    async def _check_unique(self, session, data, obj=None):
+        """Unique fields are checked before they are assigned, free values
+        are remembered, so `validate_name` does not query db.session"""
+        free = g.setdefault('_vanilla_free_values', {})
+        for field in self.model.unique_fields:
+            value = data.get(field)
+            if value is None or (obj is not None and
+                                 getattr(obj, field) == value):
+                continue
+            if await self._is_taken(session, field, value):
+                raise ModelValidationError({field: 'Already taken'})
+            free.setdefault((self.model, field), set()).add(value)
+
+    async def _verify_references(self, obj):
+        references, ids = _collect_references([obj])
+        loaded = await asyncio.gather(*[
+            self._all(select_with_access(model).filter(
+                model.id.in_(list(model_ids))))
+            for model, model_ids in ids.items()])
+        found = {model: {target.id: target for target in targets}
+                 for model, targets in zip(ids, loaded)}
+        errors = _reference_errors(references, found)[0]
+        if errors:
+            raise ModelValidationError(errors)
+
+    def _request_data(self, saved=False):
+        data = json.loads(request.data)
+        if not isinstance(data, dict):
+            abort(400, 'Object expected')
+        return self.model.__validator__.clean(data, saved=saved)
+
+    async def create(self):
+        data = self._request_data()
+        async with self.async_db.session() as session:
+            await self._check_unique(session, data)
+            obj = self.model()
+            obj.populate_from_data(data, cleaned=True)
+            self.check_permission(obj, Permission.WRITE)
+            self.pre_create(obj)
+            obj.validate_on_create(verify_relationships=False)
+            await self._verify_references(obj)
+            session.add(obj)
+            self.app.record_user_action(obj, 'created',
+                                        session=session.sync_session)
+            await session.commit()
+            # columns not set by the insert, objects are not expired on
+            # commit and can not be loaded lazily outside of the session
+            await session.refresh(obj)
+        self.post_create(obj)
+        self.app.log_user_action(obj, 'created')
+        return jsonify(obj.to_api())
+
+    async def update(self, id):
+        data = self._request_data(saved=True)
+        async with self.async_db.session() as session:
+            obj = await self._get_or_404(session, id)
+            self.check_permission(obj, Permission.WRITE)
+            if request.if_match and not request.if_match.contains(
+                    self._object_etag(obj) or ''):
+                abort(412)
+            self.pre_update(obj)
+            await self._check_unique(session, data, obj)
+            obj.populate_from_data(data, cleaned=True)
+            obj.validate()
+            self.app.record_user_action(obj, 'updated',
+                                        session=session.sync_session)
+            await session.commit()
+        self.post_update(obj)
+        self.app.log_user_action(obj, 'updated')
+        return jsonify(obj.to_api())
+
+    async def delete(self, id):
+        async with self.async_db.session() as session:
+            obj = await self._get_or_404(session, id)
+            self.check_permission(obj, Permission.WRITE)
+            obj.soft_delete(session)
+            self.app.record_user_action(obj, 'deleted',
+                                        session=session.sync_session)
+            await session.commit()
+        self.app.log_user_action(obj, 'deleted')
+        return 'DELETED'
+
+    async def hard_delete(self, id):
+        async with self.async_db.session() as session:
+            obj = await self._get_or_404(session, id, with_deleted=True)
+            self.check_permission(obj, Permission.HARD_WRITE)
+            await session.delete(obj)
+            self.app.record_user_action(obj, 'deleted',
+                                        session=session.sync_session)
+            await session.commit()
+        self.app.log_user_action(obj, 'deleted')
+        return 'DELETED'
+
+    async def restore(self, id):
+        async with self.async_db.session() as session:
+            obj = await self._get_or_404(session, id, with_deleted=True)
+            self.check_permission(obj, Permission.HARD_WRITE)
+            self.pre_restore(obj)
+            obj.deleted = False
+            self.app.record_user_action(obj, 'restored',
+                                        session=session.sync_session)
+            await session.commit()
+        self.post_restore(obj)
+        self.app.log_user_action(obj, 'restored')
+        return jsonify(obj.to_api())
+
+    async def check_if_is_unique(self, field, value):
+        value = self._unique_check_value(field, value)
+        if self.unique_cache and self.unique_cache.is_free(field, value):
+            return jsonify({'result': True})
+        async with self.async_db.session() as session:
+            taken = await self._is_taken(session, field, value)
+        return jsonify({'result': not taken})
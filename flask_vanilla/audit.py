@@ -0,0 +1,198 @@
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+
+from flask import g
+from sqlalchemy import event
+
+from . import db
+
+
+class TrackingMode:
+    # audit rows are added to the session and committed with the entity
+    TRANSACTION = 'transaction'
+    # audit rows are queued after commit and inserted by a background thread
+    ASYNC = 'async'
+
+
+class OverflowPolicy:
+    """What to do when the async queue is full"""
+    BLOCK = 'block'  # wait for the writer thread
+    DROP = 'drop'  # drop the action, `dropped` counter is incremented
+    SYNC = 'sync'  # insert the action in the caller thread
+
+
+# rows recorded in async mode, per writer, until the session commits
+_SESSION_KEY = 'vanilla_user_actions'
+
+
+def _enqueue_committed(session):
+    for writer, rows in session.info.pop(_SESSION_KEY, {}).items():
+        writer._enqueue(rows)
+
+
+def _discard_rolled_back(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+class UserActionWriter:
+    """Writes UserAction rows, configured by app config:
+    USER_ACTION_TRACKING_MODE - TrackingMode,
+    USER_ACTION_BATCH_SIZE - max rows per INSERT,
+    USER_ACTION_FLUSH_INTERVAL - max seconds an action waits in the queue,
+    USER_ACTION_QUEUE_SIZE - max queued actions,
+    USER_ACTION_QUEUE_OVERFLOW - OverflowPolicy.
+    """
+
+    def __init__(self, app, model):
+        self.app = app
+        self.model = model
+        self.dropped = 0
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        self.listen(db.session)
+        app.teardown_appcontext(self._teardown)
+        atexit.register(self.stop)
+
+    @staticmethod
+    def listen(target):
+        """Queue actions committed by sessions of `target` (async mode).
+        Listeners are shared by all writers, so they are added once."""
+        if not event.contains(target, 'after_commit', _enqueue_committed):
+            event.listen(target, 'after_commit', _enqueue_committed)
+            event.listen(target, 'after_rollback', _discard_rolled_back)
+
+    @property
+    def mode(self):
+        return self.app.config['USER_ACTION_TRACKING_MODE']
+
+    def record(self, obj, action, message=None, session=None):
+        """Should be called before the entity is committed by `session`
+        (db.session by default)"""
+        session = session or db.session
+        row = self._row(obj, action, message)
+        if self.mode == TrackingMode.ASYNC:
+            self._pending(session).append(row)
+        else:
+            session.add(self.model(**row))
+
+    def record_many(self, objs, action, message=None, session=None):
+        """Same as `record` for many objects, in transaction mode the rows
+        are written with one INSERT per USER_ACTION_BATCH_SIZE rows"""
+        session = session or db.session
+        rows = [self._row(obj, action, message) for obj in objs]
+        if self.mode == TrackingMode.ASYNC:
+            self._pending(session).extend(rows)
+            return
+        batch_size = self.app.config['USER_ACTION_BATCH_SIZE']
+        for start in range(0, len(rows), batch_size):
+            session.execute(self.model.__table__.insert().values(
+                rows[start:start + batch_size]))
+
+    def _pending(self, session):
+        return session.info.setdefault(_SESSION_KEY, {}).setdefault(self, [])
+
+    @staticmethod
+    def _row(obj, action, message):
+        return dict(name=action, message=message, entity=obj.__tablename__,
+                    user_id=g.user.id, datetime=datetime.now())
+
+    def _enqueue(self, rows):
+        self._start()
+        config = self.app.config
+        for row in rows:
+            if config['USER_ACTION_QUEUE_OVERFLOW'] == OverflowPolicy.BLOCK:
+                self._queue.put(row)
+                continue
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                if config['USER_ACTION_QUEUE_OVERFLOW'] == OverflowPolicy.SYNC:
+                    self._insert([row])
+                else:
+                    self.dropped += 1
+                    self.app.logger.warning('User action queue is full, '
+                                            'action dropped')
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _start(self):
+        # (re)started lazily: after `stop` or in a forked worker, where the
+        # thread of the parent does not exist
+        if self.running:
+            return
+        with self._lock:
+            if self.running:
+                return
+            if self._queue is None:
+                self._queue = queue.Queue(
+                    maxsize=self.app.config['USER_ACTION_QUEUE_SIZE'])
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='user-action-writer', daemon=True)
+            self._thread.start()
+
+    def _teardown(self, exception):
+        # nothing is left in the queue if the writer thread is not running
+        if not self.running:
+            self.flush()
+
+    def _run(self):
+        batch_size = self.app.config['USER_ACTION_BATCH_SIZE']
+        interval = self.app.config['USER_ACTION_FLUSH_INTERVAL']
+        while not self._stopped.is_set():
+            batch = []
+            deadline = time.monotonic() + interval
+            while len(batch) < batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if batch:
+                self._insert(batch)
+        self.flush()
+
+    def flush(self):
+        """Insert all queued actions"""
+        if not self._queue:
+            return
+        batch_size = self.app.config['USER_ACTION_BATCH_SIZE']
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= batch_size:
+                self._insert(batch)
+                batch = []
+        if batch:
+            self._insert(batch)
+
+    def stop(self):
+        """Flush queued actions and stop the writer thread, it is started
+        again by the next queued action"""
+        with self._lock:
+            self._stopped.set()
+            if self._thread:
+                self._thread.join()
+                self._thread = None
+
+    def _insert(self, rows):
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(self.model.__table__.insert(), rows)
+        except Exception:
+            self.app.logger.exception(
+                f'Failed to write {len(rows)} user actions')
@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import time
+from functools import wraps
+
+from flask import request, g, make_response, current_app
+from sqlalchemy import event
+
+from . import db, cache
+from .replicas import stick_to_primary
+
+_TABLE_VERSION_KEY = 'table_version:{}'
+
+
+def table_version(table):
+    # versions are unique tokens rather than counters, so an evicted version
+    # can not be recreated with the value of stale responses
+    key = _TABLE_VERSION_KEY.format(table)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=0)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_tables(tables):
+    """Invalidate cached responses which depend on the tables"""
+    for table in tables:
+        cache.set(_TABLE_VERSION_KEY.format(table), time.time_ns(),
+                  timeout=0)
+
+
+class ResponseCache:
+    """Cache of ModelAPI GET responses.
+    Key consists of the model, view args, normalized query args, user
+    (tenant, id, roles, permissions version) and versions of all tables the
+    response is built from, so writes to any of them invalidate it.
+    TTL is `timeout`, size is bounded by CACHE_THRESHOLD of the cache."""
+
+    def __init__(self, model_api, timeout):
+        self.model_api = model_api
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def __call__(self, view):
+        if asyncio.iscoroutinefunction(view):  # AsyncModelAPI
+            async_view = view
+
+            @wraps(async_view)
+            def view(*args, **kwargs):
+                return current_app.ensure_sync(async_view)(*args, **kwargs)
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # after a write the user reads from the primary, a response
+            # cached from a lagging replica could miss the write
+            if self.model_api._is_stream_requested() or stick_to_primary():
+                return view(*args, **kwargs)
+            key = self._key(view.__name__, kwargs)
+            cached = cache.get(key)
+            if cached is not None:
+                self.hits += 1
+                data, mimetype, etag = cached
+                response = make_response(data)
+                response.mimetype = mimetype
+                if etag:
+                    response.set_etag(etag)
+                response.headers['X-Cache'] = 'HIT'
+                return response.make_conditional(request)
+            self.misses += 1
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                etag, _ = response.get_etag()
+                cache.set(key, (response.get_data(), response.mimetype, etag),
+                          timeout=self.timeout)
+            response.headers['X-Cache'] = 'MISS'
+            return response
+
+        return wrapper
+
+    def _tables(self):
+        from .includes import include_plan  # noqa
+        model = self.model_api.model
+        return [model.__table__.name] + include_plan(model).tables()
+
+    def _key(self, view_name, view_args):
+        from .model import _PERMISSIONS_VERSION_KEY  # noqa
+        user = g.user
+        parts = [
+            self.model_api.name, view_name,
+            sorted(view_args.items()),
+            sorted(request.args.items(multi=True)),
+            getattr(user, 'tenant_id', None),
+            getattr(user, 'id', None),
+            sorted(user.compiled_permissions.roles) if user else None,
+            cache.get(_PERMISSIONS_VERSION_KEY) or 0,
+            [(table, table_version(table)) for table in self._tables()],
+        ]
+        digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+        return f'response:{self.model_api.name}:{digest}'
+
+
+def _tables_of(objects):
+    return {obj.__table__.name for obj in objects
+            if hasattr(obj, '__table__')}
+
+
+@event.listens_for(db.session, 'after_flush')
+def _track_flushed_tables(session, flush_context):
+    tables = session.info.setdefault('vanilla_changed_tables', set())
+    tables.update(_tables_of(session.new))
+    tables.update(_tables_of(session.dirty))
+    tables.update(_tables_of(session.deleted))
+
+
+@event.listens_for(db.session, 'after_bulk_update')
+@event.listens_for(db.session, 'after_bulk_delete')
+def _track_bulk_tables(update_context):
+    session = update_context.session
+    session.info.setdefault('vanilla_changed_tables', set()).add(
+        update_context.mapper.local_table.name)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _track_executed_tables(orm_execute_state):
+    # Core INSERTs of bulk create are not flushed
+    if orm_execute_state.is_insert or orm_execute_state.is_update or \
+            orm_execute_state.is_delete:
+        session = orm_execute_state.session
+        session.info.setdefault('vanilla_changed_tables', set()).add(
+            orm_execute_state.statement.table.name)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_changed_tables(session):
+    invalidate_tables(session.info.pop('vanilla_changed_tables', ()))
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_changed_tables(session):
+    session.info.pop('vanilla_changed_tables', None)
@@ -3,22 +3,30 @@ from sqlalchemy.orm.relationships import RelationshipProperty
 
 
 class VanillaColumn(Column):
+    # flags do not change SQL, so statements are cached as for Column
+    inherit_cache = True
+
     def __init__(self, *args, protected=False, mutable=True, private=False,
-                 **kwargs):
+                 heavy=False, **kwargs):
         super(VanillaColumn, self).__init__(*args, **kwargs)
         self.is_protected = protected
         self.is_mutable = mutable
         self.is_private = private
+        self.is_heavy = heavy
 
     def copy(self, *args, **kwargs):
         c = super(VanillaColumn, self).copy(*args, **kwargs)
         c.is_protected = self.is_protected
         c.is_mutable = self.is_mutable
         c.is_private = self.is_private
+        c.is_heavy = self.is_heavy
         return c
 
 
 class VanillaRelationshipProperty(RelationshipProperty):
+    # loader options (includes) of the relationship are cached as well
+    inherit_cache = True
+
     def __init__(self, *args, protected=True, **kwargs):
         super(VanillaRelationshipProperty, self).__init__(*args, **kwargs)
         self.is_protected = protected
@@ -0,0 +1,71 @@
+import hashlib
+import json
+
+from flask import request, g
+from sqlalchemy import func, text
+
+from . import cache
+from .caching import table_version
+
+
+class CountStrategy:
+    EXACT = 'exact'  # COUNT(*) of filtered query
+    CACHED = 'cached'  # exact count, cached per filters, invalidated on write
+    ESTIMATED = 'estimated'  # planner estimate or capped count
+    NONE = 'none'  # no count, only `has_more`
+    ALL = [EXACT, CACHED, ESTIMATED, NONE]
+
+
+def exact_count(query):
+    # subquery() disables eager loads of includes
+    subquery = query.order_by(None).subquery()
+    return query.session.query(func.count()).select_from(subquery).scalar()
+
+
+def cached_count(query, model, ignored_params, timeout, with_deleted=False,
+                 name=None):
+    """Exact count, memoized per API `name` (table name by default), filter
+    params and user"""
+    key = count_cache_key(model, ignored_params, with_deleted, name)
+    count = cache.get(key)
+    if count is None:
+        count = exact_count(query)
+        cache.set(key, count, timeout=timeout)
+    return count
+
+
+def count_cache_key(model, ignored_params, with_deleted=False, name=None):
+    """`with_deleted` - whether deleted rows are counted, it is a param
+    of the request usually ignored as a filter. `name` - of the API, APIs
+    of one model may filter it differently (query_access_filter)"""
+    user = g.user
+    parts = [
+        name or model.__tablename__,
+        sorted((k, v) for k, v in request.args.items(multi=True)
+               if k not in ignored_params),
+        with_deleted,
+        getattr(user, 'tenant_id', None),
+        getattr(user, 'id', None),
+        sorted(user.compiled_permissions.roles) if user else None,
+        table_version(model.__tablename__),
+    ]
+    return 'count:' + hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def estimated_count(query, model, cap):
+    """Row estimate of the planner (PostgreSQL), for other dialects - count
+    limited by `cap` rows, so result is exact below the cap"""
+    query = query.order_by(None).enable_eagerloads(False)
+    session = query.session
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        statement = query.statement.compile(
+            dialect=session.get_bind().dialect,
+            compile_kwargs={'literal_binds': True})
+        plan = session.execute(
+            text(f'EXPLAIN (FORMAT JSON) {statement}')).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    subquery = query.with_entities(model.id).limit(cap).subquery()
+    return session.query(func.count()).select_from(subquery).scalar()
@@ -0,0 +1,238 @@
+import json
+import re
+from datetime import datetime, date
+
+from flask import abort
+from sqlalchemy import or_, literal, Boolean, Numeric, String
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+from . import Json
+
+_TRUE = ('true', '1', 'yes')
+_FALSE = ('false', '0', 'no')
+
+
+def parse_bool(value):
+    """Boolean query param: request.args.get(name, type=parse_bool)"""
+    return coerce_value(bool, value)
+
+
+def coerce_value(python_type, value):
+    """Convert query string value to column python type"""
+    if not isinstance(value, str) or python_type in (str, object):
+        return value
+    if python_type == bool:
+        if value.lower() in _TRUE:
+            return True
+        if value.lower() in _FALSE:
+            return False
+        raise ValueError(f'Invalid boolean: {value}')
+    if python_type == datetime:
+        return datetime.fromisoformat(value)
+    if python_type == date:
+        return date.fromisoformat(value)
+    try:
+        return python_type(value)
+    except ArithmeticError:  # decimal.InvalidOperation of Numeric
+        raise ValueError(f'Invalid number: {value}')
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _eq(column, values):
+    return column == values[0] if len(values) == 1 else column.in_(values)
+
+
+def _in(column, values):
+    return column.in_(values)
+
+
+def _null(column, values):
+    return column.is_(None) if values[0] else column.isnot(None)
+
+
+def _prefix(column, values):
+    return column.like(_escape_like(values[0]) + '%', escape='\\')
+
+
+# suffix: (predicate builder, split comma separated values, value type)
+# value type None means column python type
+OPERATORS = {
+    '-min': (lambda column, values: column >= values[0], False, None),
+    '-max': (lambda column, values: column <= values[0], False, None),
+    '-ne': (lambda column, values: column != values[0], False, None),
+    '-in': (_in, True, None),
+    '-null': (_null, False, bool),
+    '-like': (lambda column, values: column.like(values[0]), False, str),
+    '-prefix': (_prefix, False, str),
+    '': (_eq, False, None),
+}
+_STRING_OPERATORS = ('-like', '-prefix')
+_JSON_PATH_OPERATORS = ('-min', '-max', '-ne', '-in', '-null', '')
+_JSON_KEY = re.compile(r'^\w+$')
+
+
+class json_path(FunctionElement):
+    """Value of a JSON column at `keys`, compared as `type_`"""
+    name = 'json_path'
+    inherit_cache = False  # keys are not part of the cache key
+
+    def __init__(self, column, keys, type_=String):
+        self.keys = keys
+        self.type = type_()
+        super(json_path, self).__init__(column)
+
+
+def _json_column(element, compiler, **kw):
+    return compiler.process(element.clauses.clauses[0], **kw)
+
+
+@compiles(json_path)
+def _json_path(element, compiler, **kw):
+    # SQLite JSON1, json_extract returns SQL values of JSON scalars
+    path = '$' + ''.join(f'[{key}]' if key.isdigit() else f'.{key}'
+                         for key in element.keys)
+    return f'json_extract({_json_column(element, compiler, **kw)}, ' \
+           f'{compiler.process(literal(path), **kw)})'
+
+
+@compiles(json_path, 'mysql')
+def _json_path_mysql(element, compiler, **kw):
+    sql = _json_path(element, compiler, **kw)
+    return f'json_unquote({sql})' if isinstance(element.type, String) \
+        else sql
+
+
+@compiles(json_path, 'postgresql')
+def _json_path_postgresql(element, compiler, **kw):
+    path = '{' + ','.join(element.keys) + '}'
+    sql = f'({_json_column(element, compiler, **kw)} #>> ' \
+          f'{compiler.process(literal(path), **kw)})'
+    if isinstance(element.type, Numeric):
+        return f'CAST({sql} AS NUMERIC)'
+    if isinstance(element.type, Boolean):
+        return f'CAST({sql} AS BOOLEAN)'
+    return sql
+
+
+def _json_value(value):
+    """Query string value as JSON scalar: 5, true, "5", otherwise string.
+    Values of a JSON body (bulk update filter) are already decoded."""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return value
+    if not isinstance(value, (str, int, float, bool)):
+        raise ValueError('JSON scalar expected')
+    return value
+
+
+def _json_type(value):
+    if isinstance(value, bool):
+        return Boolean
+    if isinstance(value, (int, float)):
+        return Numeric
+    return String
+
+
+class FilterCompiler:
+    """Compiles list query params into predicates.
+    Param is `<field><operator>`, e.g. `created_at-min`, `name-prefix`,
+    fields separated with `|` make OR group: `name|text-like=%foo%`.
+    Builders are resolved once per model, values are coerced to column
+    python type.
+    Native Json columns have JSON path filters: `<field>.<key>.<key>`, e.g.
+    `meta.size-min=10`, `meta.tags.0=red`."""
+
+    def __init__(self, model, fields):
+        self.model = model
+        self._builders = {}
+        self._fields = {}
+        self._json_columns = {}
+        for field in fields:
+            column = getattr(model, field)
+            if isinstance(column.type, Json) and column.type.native:
+                self._json_columns[field] = column
+                continue
+            try:
+                python_type = column.type.python_type
+            except NotImplementedError:
+                continue
+            if python_type == object:  # e.g. Json, can not be compared
+                continue
+            for suffix, (builder, split, value_type) in OPERATORS.items():
+                if suffix in _STRING_OPERATORS and python_type != str:
+                    continue
+                self._builders[field + suffix] = (
+                    column, builder, split, value_type or python_type)
+                self._fields[field + suffix] = (field, suffix)
+
+    def __contains__(self, name):
+        return name in self._builders or self._json_path(name) is not None
+
+    def _json_path(self, name):
+        """(column, keys, operator) of a JSON path param"""
+        field, _, path = name.partition('.')
+        if not path or field not in self._json_columns:
+            return None
+        suffix = next((s for s in _JSON_PATH_OPERATORS
+                       if s and path.endswith(s)), '')
+        keys = path[:len(path) - len(suffix)].split('.')
+        if not all(_JSON_KEY.match(key) for key in keys):
+            return None
+        return self._json_columns[field], keys, suffix
+
+    def describe(self, name):
+        """(field, operator) of a single column param, None for groups"""
+        return self._fields.get(name)
+
+    def predicate(self, name, values):
+        """Predicate of a param, aborts with 400 if it is not supported"""
+        if name in self._builders:
+            return self._predicate(name, values)
+        json_path_param = self._json_path(name)
+        if json_path_param:
+            return self._json_predicate(name, values, *json_path_param)
+        if '|' not in name:
+            abort(400, f'Unsupported filter: {name}')
+        suffix = next((s for s in OPERATORS if s and name.endswith(s)), '')
+        fields = name[:len(name) - len(suffix)].split('|')
+        for field in fields:
+            if field + suffix not in self._builders:
+                abort(400, f'Unsupported filter: {field + suffix}')
+        return or_(*[self._predicate(field + suffix, values)
+                     for field in fields])
+
+    def _predicate(self, name, values):
+        column, builder, split, value_type = self._builders[name]
+        if split:
+            values = [v for value in values for v in (
+                value.split(',') if isinstance(value, str) else [value])]
+        try:
+            values = [coerce_value(value_type, value) for value in values]
+        except (ValueError, TypeError):
+            abort(400, f'Invalid value of {name}: '
+                       f'{",".join(map(str, values))}')
+        return builder(column, values)
+
+    def _json_predicate(self, name, values, column, keys, suffix):
+        if suffix == '-null':
+            try:
+                is_null = coerce_value(bool, values[0])
+            except ValueError:
+                abort(400, f'Invalid value of {name}: {values[0]}')
+            return _null(json_path(column, keys), [is_null])
+        if suffix == '-in':
+            values = [v for value in values for v in (
+                value.split(',') if isinstance(value, str) else [value])]
+        try:
+            values = [_json_value(value) for value in values]
+        except ValueError:
+            abort(400, f'Invalid value of {name}: '
+                       f'{",".join(map(str, values))}')
+        builder = OPERATORS[suffix][0]
+        return builder(json_path(column, keys, _json_type(values[0])), values)
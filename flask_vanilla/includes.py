@@ -0,0 +1,131 @@
+from functools import lru_cache
+
+from flask import request, abort, current_app
+from sqlalchemy import and_, false
+from sqlalchemy.orm import selectinload, joinedload
+
+from .model import BaseModel, Permission
+
+
+class IncludeNode:
+    def __init__(self, model, key):
+        relationships = model.__mapper__.relationships
+        if key not in relationships:
+            abort(400, f'No such relation: {key}')
+        self.key = key
+        self.relationship = relationships[key]
+        self.attribute = getattr(model, key)
+        self.target = self.relationship.mapper.class_
+        self.uselist = self.relationship.uselist
+        self.children = []
+
+
+def _child(model, nodes, key):
+    for node in nodes:
+        if node.key == key:
+            return node
+    node = IncludeNode(model, key)
+    nodes.append(node)
+    return node
+
+
+class IncludePlan:
+    """Relations requested with `include=posts,posts.comments`.
+    Collections are loaded with selectinload (no row explosion with LIMIT),
+    many-to-one relations with joinedload. Soft-deleted and not readable
+    related objects are excluded in SQL by loader criteria."""
+
+    def __init__(self, model, include, max_depth):
+        self.model = model
+        self.nodes = []
+        for path in filter(None, include.split(',')):
+            keys = path.split('.')
+            if len(keys) > max_depth:
+                abort(400, f'Max include depth is {max_depth}: {path}')
+            target, nodes = model, self.nodes
+            for key in keys:
+                node = _child(target, nodes, key)
+                target, nodes = node.target, node.children
+
+    @property
+    def keys(self):
+        return [node.key for node in self.nodes]
+
+    def tables(self):
+        tables, nodes = [], list(self.nodes)
+        while nodes:
+            node = nodes.pop()
+            tables.append(node.target.__table__.name)
+            nodes.extend(node.children)
+        return tables
+
+    def options(self):
+        """Loader options, should be built per request (criteria depend on
+        the current user)"""
+        return [option for node in self.nodes
+                for option in self._options(node, None)]
+
+    def _options(self, node, parent):
+        attribute = node.attribute
+        criteria = read_criteria(node.target)
+        if criteria is not None:
+            attribute = attribute.and_(criteria)
+        if parent is None:
+            loader = selectinload if node.uselist else joinedload
+            option = loader(attribute)
+        else:
+            option = parent.selectinload(attribute) if node.uselist else \
+                parent.joinedload(attribute)
+        if not node.children:
+            return [option]
+        return [o for child in node.children
+                for o in self._options(child, option)]
+
+    def serialize(self, obj, data):
+        self._serialize_relations(obj, self.nodes, data)
+
+    def _serialize_relations(self, obj, nodes, data):
+        for node in nodes:
+            # relations loaded by the plan are already filtered in SQL,
+            # lazy loaded ones (objects not loaded by ModelAPI) are checked
+            loaded = node.key in obj.__dict__
+            value = getattr(obj, node.key)
+            if node.uselist:
+                data[node.key] = [
+                    self._serialize(item, node.children) for item in value
+                    if loaded or _is_readable(item)]
+            elif value is None or (not loaded and not _is_readable(value)):
+                data[node.key] = None
+            else:
+                data[node.key] = self._serialize(value, node.children)
+
+    def _serialize(self, obj, nodes):
+        data = obj.to_api(join_relations=False)
+        self._serialize_relations(obj, nodes, data)
+        return data
+
+
+def read_criteria(model):
+    if not issubclass(model, BaseModel):
+        return None
+    criteria = model.deleted == false()
+    permission = model.permission_criteria(Permission.READ)
+    return criteria if permission is None else and_(criteria, permission)
+
+
+def _is_readable(obj):
+    if not isinstance(obj, BaseModel):
+        return True
+    return not obj.deleted and obj.check_permission(Permission.READ,
+                                                    abort_on_fail=False)
+
+
+def include_plan(model, include=None):
+    if include is None:
+        include = request.args.get('include', '')
+    return _compile(model, include, current_app.config['INCLUDE_MAX_DEPTH'])
+
+
+@lru_cache(maxsize=1024)
+def _compile(model, include, max_depth):
+    return IncludePlan(model, include, max_depth)
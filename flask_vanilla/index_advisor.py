@@ -0,0 +1,114 @@
+import json
+import threading
+
+from sqlalchemy import inspect, text
+
+# operators which can use an index as equality or as a range
+EQUALITY_OPERATORS = ('', '-in', '-null')
+RANGE_OPERATORS = ('-min', '-max', '-prefix')
+
+
+class QueryPatternRecorder:
+    """Records filter/sort patterns of list requests to a JSON lines file
+    (QUERY_PATTERNS_FILE config), every distinct pattern is written once
+    per process."""
+
+    def __init__(self, path):
+        self.path = path
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def record(self, table, equality, ranges, sort):
+        pattern = (table, tuple(sorted(equality)), tuple(sorted(ranges)),
+                   sort)
+        if pattern in self._seen:
+            return
+        with self._lock:
+            if pattern in self._seen:
+                return
+            self._seen.add(pattern)
+            with open(self.path, 'a') as f:
+                f.write(json.dumps({'table': table,
+                                    'equality': pattern[1],
+                                    'ranges': pattern[2],
+                                    'sort': sort}) + '\n')
+
+
+def load_patterns(path):
+    patterns = set()
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            p = json.loads(line)
+            patterns.add((p['table'], tuple(p['equality']),
+                          tuple(p['ranges']), p['sort']))
+    return sorted(patterns, key=repr)
+
+
+def suggested_columns(table, equality, ranges, sort):
+    """Index columns: framework predicates and equality filters first,
+    then one range or sort column"""
+    columns = [c for c in ('tenant_id', 'deleted') if c in table.c]
+    columns += [c for c in equality if c not in columns]
+    tail = ranges[0] if ranges else sort
+    if tail and tail not in columns:
+        columns.append(tail)
+    return columns
+
+
+def _is_covered(columns, indexes):
+    """Index can serve the pattern if it starts with the suggested columns
+    (tenant_id/deleted may be skipped, they are not selective)"""
+    selective = [c for c in columns if c not in ('tenant_id', 'deleted')]
+    if not selective:
+        return True
+    for index_columns in indexes:
+        leading = [c for c in index_columns
+                   if c not in ('tenant_id', 'deleted')]
+        if leading[:len(selective)] == selective:
+            return True
+    return False
+
+
+def _explain(connection, table, columns, sort):
+    where = ' AND '.join(f'{c} = :{c}' for c in columns if c != sort)
+    sql = f'SELECT id FROM {table.name}'
+    if where:
+        sql += f' WHERE {where}'
+    if sort:
+        sql += f' ORDER BY {sort}'
+    params = {c: None for c in columns if c != sort}
+    if connection.dialect.name == 'sqlite':
+        sql = 'EXPLAIN QUERY PLAN ' + sql
+    else:
+        sql = 'EXPLAIN ' + sql
+    rows = connection.execute(text(sql), params).fetchall()
+    return [' '.join(str(v) for v in row) for row in rows]
+
+
+def advise(db, patterns):
+    """Returns list of (pattern, plan, ddl), ddl is None if there is an
+    index for the pattern"""
+    results = []
+    inspector = inspect(db.engine)
+    with db.engine.connect() as connection:
+        for pattern in patterns:
+            table_name, equality, ranges, sort = pattern
+            table = db.metadata.tables.get(table_name)
+            if table is None:
+                continue
+            indexes = [i['column_names'] for i in
+                       inspector.get_indexes(table_name)]
+            indexes += [c['column_names'] for c in
+                        inspector.get_unique_constraints(table_name)]
+            indexes.append(inspector.get_pk_constraint(table_name)
+                           ['constrained_columns'])
+            columns = suggested_columns(table, equality, ranges, sort)
+            plan = _explain(connection, table, columns, sort)
+            ddl = None
+            if not _is_covered(columns, indexes):
+                ddl = (f'CREATE INDEX ix_{table_name}_{"_".join(columns)} '
+                       f'ON {table_name} ({", ".join(columns)});')
+            results.append((pattern, plan, ddl))
+    return results
@@ -0,0 +1,104 @@
+import re
+import time
+from collections import Counter
+
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_IN_LIST = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+
+# WSGI environ key overriding SQL_REPEATED_QUERY_LIMIT for one request
+REPEATED_QUERY_LIMIT_ENVIRON = 'vanilla.repeated_query_limit'
+
+
+class RepeatedQueryError(Exception):
+    """Raised in strict mode (SQL_REPEATED_QUERY_LIMIT) when the same
+    statement is executed too many times in one request, usually N+1"""
+
+
+class RequestSQLStats:
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.statements = Counter()
+
+    def repeated(self, min_count=2):
+        return [(statement, count) for statement, count in
+                self.statements.most_common() if count >= min_count]
+
+
+def statement_shape(statement):
+    """Statement with collapsed IN lists, so `IN (?, ?)` and `IN (?)` match"""
+    return _IN_LIST.sub('(?)', statement)
+
+
+def request_sql_stats():
+    """Stats of the current request, None outside of request"""
+    if not has_request_context():
+        return None
+    stats = g.get('_vanilla_sql_stats')
+    if stats is None:
+        stats = g._vanilla_sql_stats = RequestSQLStats()
+    return stats
+
+
+def init_sql_instrumentation(app):
+    """Counts queries and DB time per request.
+    Config:
+    SQL_INSTRUMENTATION - enable,
+    SQL_DEBUG_HEADERS - add X-DB-Queries/X-DB-Time headers, app.debug if
+    not set,
+    SQL_QUERY_WARNING_THRESHOLD - log warning if request runs more queries,
+    SQL_REPEATED_QUERY_LIMIT - fail with RepeatedQueryError if a statement
+    is executed so many times in a request (strict mode, for tests), can be
+    set per request by REPEATED_QUERY_LIMIT_ENVIRON.
+    """
+
+    def enabled():
+        # listeners are global, so requests of other apps are skipped
+        return has_request_context() and \
+            current_app._get_current_object() is app and \
+            app.config['SQL_INSTRUMENTATION']
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context,
+                              executemany):
+        if enabled():
+            conn.info.setdefault('vanilla_query_start', []).append(
+                time.perf_counter())
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context,
+                             executemany):
+        if not enabled() or not conn.info.get('vanilla_query_start'):
+            return
+        stats = request_sql_stats()
+        stats.time += time.perf_counter() - conn.info[
+            'vanilla_query_start'].pop()
+        stats.count += 1
+        shape = statement_shape(statement)
+        stats.statements[shape] += 1
+        limit = request.environ.get(REPEATED_QUERY_LIMIT_ENVIRON,
+                                    app.config['SQL_REPEATED_QUERY_LIMIT'])
+        if limit and stats.statements[shape] >= limit:
+            raise RepeatedQueryError(
+                f'Statement executed {stats.statements[shape]} times: '
+                f'{shape}')
+
+    @app.after_request
+    def report_sql_stats(response):
+        if not app.config['SQL_INSTRUMENTATION']:
+            return response
+        stats = request_sql_stats()
+        headers = app.config['SQL_DEBUG_HEADERS']
+        if headers or (headers is None and app.debug):
+            response.headers['X-DB-Queries'] = str(stats.count)
+            response.headers['X-DB-Time'] = f'{stats.time * 1000:.3f}ms'
+        if stats.count > app.config['SQL_QUERY_WARNING_THRESHOLD']:
+            repeated = ', '.join(f'{count}x {statement[:100]}' for
+                                 statement, count in stats.repeated()[:3])
+            app.logger.warning(
+                f'{stats.count} queries ({stats.time * 1000:.1f}ms) for '
+                f'{request.method} {request.path}, repeated: {repeated}')
+        return response
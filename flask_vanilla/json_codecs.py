@@ -0,0 +1,147 @@
+import zlib
+from datetime import datetime, date
+
+from flask import current_app, has_app_context
+
+
+class JsonCodec:
+    def __init__(self, name, dumps, loads):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+
+_CODECS = {}
+# `auto` codec - first registered of these
+AUTO_ORDER = ('orjson', 'ujson', 'json')
+
+
+def register_codec(name, dumps, loads):
+    """Register a codec of Json columns, `dumps` returns str"""
+    _CODECS[name] = JsonCodec(name, dumps, loads)
+
+
+def get_codec(name=None):
+    """Codec by name, JSON_CODEC config by default"""
+    if name is None:
+        name = current_app.config['JSON_CODEC'] if has_app_context() \
+            else 'auto'
+    if name == 'auto':
+        name = next(n for n in AUTO_ORDER if n in _CODECS)
+    codec = _CODECS.get(name)
+    if codec is None:
+        raise ValueError(f'Unknown JSON codec: {name}')
+    return codec
+
+
+# compress: (compress, decompress), stored data starts with `<name>:`
+COMPRESSORS = {'zlib': (zlib.compress, zlib.decompress)}
+
+
+def compress(data, name):
+    return f'{name}:'.encode() + COMPRESSORS[name][0](data)
+
+
+def stored_text(value):
+    """JSON text of a stored value, bytes are decompressed if needed"""
+    if isinstance(value, str):
+        return value
+    value = bytes(value)
+    for name, (_, decompress) in COMPRESSORS.items():
+        prefix = f'{name}:'.encode()
+        if value.startswith(prefix):
+            return decompress(value[len(prefix):]).decode()
+    return value.decode()
+
+
+class LazyJson:
+    """Stored JSON value, decoded on first access (Json(lazy=True)).
+    Values which were not accessed are written back and serialized by
+    VanillaJSONEncoder as the stored text, without decoding."""
+
+    __slots__ = ('_stored', '_codec', '_value', '_loaded')
+
+    def __init__(self, stored, codec=None):
+        self._stored = stored
+        self._codec = codec
+        self._value = None
+        self._loaded = False
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    @property
+    def value(self):
+        if not self._loaded:
+            self._value = get_codec(self._codec).loads(self.raw_text())
+            self._loaded = True
+        return self._value
+
+    def raw_text(self):
+        self._stored = stored_text(self._stored)  # decompressed once
+        return self._stored
+
+    def __getattr__(self, name):
+        return getattr(self.value, name)
+
+    def __getitem__(self, key):
+        return self.value[key]
+
+    def __setitem__(self, key, value):
+        self.value[key] = value
+
+    def __iter__(self):
+        return iter(self.value)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __contains__(self, item):
+        return item in self.value
+
+    def __bool__(self):
+        return bool(self.value)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyJson):
+            other = other.value
+        return self.value == other
+
+    def __repr__(self):
+        return f'LazyJson({self.value!r})'
+
+
+def default(o):
+    """Types not supported by the codecs, same as VanillaJSONEncoder"""
+    if isinstance(o, LazyJson):
+        return o.value
+    if isinstance(o, (date, datetime)):
+        return o.isoformat()
+    if getattr(type(o), '__serializer__', None) is not None:
+        return o.to_api()
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON '
+                    f'serializable')
+
+
+try:
+    import orjson
+except ImportError:
+    pass
+else:
+    def _orjson_dumps(value):
+        return orjson.dumps(value, default=default,
+                            option=orjson.OPT_NON_STR_KEYS).decode()
+
+    register_codec('orjson', _orjson_dumps, orjson.loads)
+
+try:
+    import ujson
+except ImportError:
+    pass
+else:
+    def _ujson_dumps(value):
+        return ujson.dumps(value, default=default,
+                           escape_forward_slashes=False)
+
+    register_codec('ujson', _ujson_dumps, ujson.loads)
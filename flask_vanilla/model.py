@@ -1,21 +1,21 @@
-from datetime import datetime, date
+from datetime import datetime
 from sqlalchemy import (
     Boolean, Integer, String, DateTime,
-    ForeignKey, UniqueConstraint, inspect
+    ForeignKey, UniqueConstraint, Index, inspect, event
 )
 from sqlalchemy.orm import validates
-from sqlalchemy.sql.expression import true
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy.sql.expression import true, false
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm.interfaces import MANYTOONE
 import json
 from flask import request, g, abort
-from flask_validator import (ValidateNumeric, ValidateInteger, ValidateLength,
-                             ValidateString)
 
 from flask import json
-from . import db
-from .validation import ModelValidationError, ValidateDate, ValidateDateTime
+from . import db, cache
+from .validation import ModelValidationError, CompiledValidator
 from .query import QueryWithSoftDeleteAndAccess
+from .serialization import ModelSerializer
 
 
 class VersionMixin:
@@ -37,6 +37,16 @@ class BaseModel(object):
 
     query_class = QueryWithSoftDeleteAndAccess
 
+    @declared_attr
+    def __table_args__(cls):
+        return tuple(cls.table_indexes())
+
+    @classmethod
+    def table_indexes(cls):
+        """Indexes for predicates added by the framework, if you define
+        __table_args__ in a model, add them: `*cls.table_indexes()`"""
+        return [Index(f'ix_{cls.__tablename__}_deleted_id', 'deleted', 'id')]
+
     def soft_delete(self, session):
         """Mark this object as deleted."""
         self.deleted = True
@@ -44,27 +54,30 @@ class BaseModel(object):
         session.add(self)
 
     def populate_from_request(self):
-        self.populate(**json.loads(request.data))
+        self.populate_from_data(json.loads(request.data))
+
+    def populate_from_data(self, data, cleaned=False):
+        """Populate from a client payload, e.g. an item of a bulk request,
+        `cleaned` - data is already checked by `__validator__.clean`"""
+        if cleaned:
+            self._assign(data)
+        else:
+            self.populate(**data)
 
     def populate(self, **data):
         data.pop('id', None)  # can be protected but better to exclude it
-        if request:
-            errors = {}
-            saved = inspect(self).persistent
-            for key, value in data.items():
-                field = self.__table__.columns._data.get(key)
-                if field is None or field.is_protected or field.is_private or (
-                        saved and not field.is_mutable):
-                    continue
-                try:
-                    setattr(self, key, value)
-                except ValueError as e:
-                    errors[key] = str(e)
-            if errors:
-                raise ModelValidationError(errors)
-        else:
-            for key, value in data.items():
+        data = self.__validator__.clean(data, saved=inspect(self).persistent)
+        self._assign(data)
+
+    def _assign(self, data):
+        errors = {}
+        for key, value in data.items():
+            try:
                 setattr(self, key, value)
+            except ValueError as e:  # `@validates` and custom listeners
+                errors[key] = str(e)
+        if errors:
+            raise ModelValidationError(errors)
 
     def as_dict(self):
         self.id  # lazy reload for __dict__, a bit of hack
@@ -72,89 +85,98 @@ class BaseModel(object):
                 k != '_sa_instance_state'}
 
     def to_api(self, join_relations=True):
-        self.id  # lazy reload for __dict__, a bit of hack
-        public_cols = [col.name for col in self.__table__.columns
-                       if not col.is_private]
-        data = {k: v for k, v in self.as_dict().items() if
-                k in public_cols}
+        data = self.__serializer__.serialize(self)
 
         # whether to include relationships, example: include=posts,comments
         if request.args.get('include') and join_relations:
-            for relation in request.args.get('include').split(','):
-                try:
-                    entry = getattr(self, relation)  # for lazy load
-                    if isinstance(entry, BaseModel):
-                        data[relation] = entry.to_api(
-                            join_relations=False) \
-                            if not entry.deleted and entry.check_permission(
-                            Permission.READ, abort_on_fail=False) else None
-                    elif isinstance(entry, list):
-                        data[relation] = [i.to_api(join_relations=False) for i
-                                          in entry if
-                                          not i.deleted and i.check_permission(
-                                              Permission.READ,
-                                              abort_on_fail=False)]
-                except AttributeError:
-                    abort(400, f"No such relation: {relation}")
+            from .includes import include_plan
+            include_plan(self.__class__).serialize(self, data)
         return data
 
     @classmethod
     def access_filter(cls, query):
         return query
 
+    @classmethod
+    def permission_filter(cls, query, action):
+        """SQL version of `_check_permission` for set-based operations"""
+        criteria = cls.permission_criteria(action)
+        return query if criteria is None else query.filter(criteria)
+
+    @classmethod
+    def permission_criteria(cls, action):
+        """SQL expression of `_check_permission`, None if all allowed"""
+        return None
+
+    # fields checked with `taken_values` by bulk create
+    unique_fields = ()
+
+    @classmethod
+    def unique_scope(cls):
+        """(key, criteria) of the scope unique values are checked in,
+        should match the unique index of the model"""
+        return None, None
+
+    @classmethod
+    def unique_scope_query(cls):
+        # soft deleted rows are in the unique index too
+        _, criteria = cls.unique_scope()
+        query = cls.query.raw()
+        return query if criteria is None else query.filter(criteria)
+
+    @classmethod
+    def is_unique(cls, field, value):
+        free = g.get('_vanilla_free_values', {}).get((cls, field))
+        if free and value in free:
+            free.discard(value)  # checked by `taken_values`, used once
+            return True
+        query = cls.unique_scope_query().filter(getattr(cls, field) == value)
+        return not db.session.query(query.exists()).scalar()
+
+    @classmethod
+    def taken_values(cls, field, values, chunk_size=500):
+        """Subset of `values` already used in the unique scope, one IN query
+        per chunk. Other values are remembered for the request, so their
+        assignment (e.g. `validate_name`) does not query again."""
+        column = getattr(cls, field)
+        values = list(set(values))
+        taken = set()
+        for start in range(0, len(values), chunk_size):
+            query = cls.unique_scope_query().with_entities(column).filter(
+                column.in_(values[start:start + chunk_size]))
+            taken.update(value for value, in query)
+        g.setdefault('_vanilla_free_values', {}).setdefault(
+            (cls, field), set()).update(set(values) - taken)
+        return taken
+
     @classmethod
     def __declare_last__(cls):
-        for col in cls.__table__.columns:
-            type = col.type.python_type
-
-            if type == str:
-                ValidateString(getattr(cls, col.name), allow_null=col.nullable,
-                               throw_exception=True)
-                if col.type.length:
-                    ValidateLength(
-                        getattr(cls, col.name), col.type.length,
-                        throw_exception=True,
-                        message=f'Max length is {col.type.length}')
-            elif type == int:
-                ValidateInteger(
-                    getattr(cls, col.name),
-                    allow_null=col.nullable, throw_exception=True)
-            elif type == float:
-                ValidateNumeric(
-                    getattr(cls, col.name),
-                    allow_null=col.nullable, throw_exception=True)
-            elif type == date:
-                ValidateDate(getattr(cls, col.name), allow_null=col.nullable,
-                             throw_exception=True)
-            elif type == datetime:
-                ValidateDateTime(getattr(cls, col.name),
-                                 allow_null=col.nullable, throw_exception=True)
-
-        BaseModel.validators()
-
-    @staticmethod
-    def validators():
-        """Put here your validators"""
-        pass
+        cls.__serializer__ = ModelSerializer(cls)
+        cls.__validator__ = CompiledValidator(cls)
+
+    @classmethod
+    def validators(cls):
+        """Put here your validators: {column: callable or list of
+        callables}, a callable gets a value (already type checked) and
+        returns it, possibly converted, or raises ValueError"""
+        return {}
 
     def _validate_not_null_columns(self):
         errors = {}
-        public_cols = [col for col in self.__table__.columns
-                       if not col.is_private]
-        for col in public_cols:
-            if not col.nullable and \
-                    not col.default and \
-                    not col.server_default \
-                    and not col.autoincrement \
-                    and not getattr(self, col.name):
-                errors[col.name] = 'Should be specified'
+        for name in self.__validator__.required:
+            if not getattr(self, name):
+                errors[name] = 'Should be specified'
         if errors:
             raise ModelValidationError(errors=errors)
 
-    def validate_on_create(self):
+    def validate_on_create(self, verify_relationships=True):
         self._validate_not_null_columns()
         self.validate()
 
+    @classmethod
+    def _verified_references(cls):
+        return ()
+
     def validate(self):
         pass
 
@@ -192,8 +214,25 @@ class BaseEntity(BaseModel):
         )
         return query
 
-    def populate_from_request(self):
-        super(BaseEntity, self).populate_from_request()
+    @classmethod
+    def table_indexes(cls):
+        return super(BaseEntity, cls).table_indexes() + [
+            Index(f'ix_{cls.__tablename__}_user_id_access',
+                  'user_id', 'access')]
+
+    @classmethod
+    def permission_criteria(cls, action):
+        if not g.user:
+            return false()
+        if g.user.has_role(DefaultRoles.SUPER_ADMIN.name):
+            return None
+        if action == Permission.READ:
+            return (cls.access == AccessType.PUBLIC) | (
+                    cls.user_id == g.user.id)
+        return cls.user_id == g.user.id
+
+    def populate_from_data(self, data, cleaned=False):
+        super(BaseEntity, self).populate_from_data(data, cleaned)
         self.user_id = g.user.id
 
     def _check_permission(self, action):
@@ -208,13 +247,19 @@ class BaseEntity(BaseModel):
 
         return True
 
-    def is_unique(self, field, value):
-        _filter = {field: value, 'user_id': g.user.id}
-        return not bool(self.__class__.query.filter_by(
-            **_filter).count())
+    @classmethod
+    def unique_scope(cls):
+        return g.user.id, cls.user_id == g.user.id
 
-    def _verify_relationships(self):
-        for name, rel in inspect(self.__class__).relationships.items():
+    @classmethod
+    def _verified_references(cls):
+        """(column name, related model) of protected many-to-one relations
+        with a foreign key set by the user"""
+        references = cls.__dict__.get('_vanilla_verified_references')
+        if references is not None:
+            return references
+        references = []
+        for name, rel in inspect(cls).relationships.items():
             if not rel.is_protected or rel.direction != MANYTOONE:
                 continue
 
@@ -224,17 +269,14 @@ class BaseEntity(BaseModel):
             rel_class = rel.mapper.class_
             if not issubclass(rel_class, BaseEntity):
                 continue
-            unverified_id = getattr(self, rel_column.name)
-            if not unverified_id:
-                continue
-            obj = rel_class.query.get(unverified_id)
-            if not obj:
-                raise ModelValidationError(errors={
-                    rel_column:
-                        f'{unverified_id} : object with such id not found'
-                })
-            else:
-                obj.check_permission(Permission.WRITE)
+            references.append((rel_column.name, rel_class))
+        cls._vanilla_verified_references = references
+        return references
+
+    def _verify_relationships(self):
+        errors = verify_relationships([self])[0]
+        if errors:
+            raise ModelValidationError(errors=errors)
 
     def _verify_relationships_old(self):
         for name, rel in inspect(self.__class__).relationships.items():
@@ -260,18 +302,85 @@ class BaseEntity(BaseModel):
             else:
                 obj.check_permission(Permission.WRITE)
 
-    def validate_on_create(self):
+    def validate_on_create(self, verify_relationships=True):
+        """`verify_relationships=False` - references are checked by the
+        caller, e.g. for many objects with `verify_relationships()`"""
         self._validate_not_null_columns()
-        self._verify_relationships()
+        if verify_relationships:
+            self._verify_relationships()
         self.validate()
 
     access = db.Column(String, default=AccessType.TENANT_PUBLIC)
 
 
+def verify_relationships(objects, chunk_size=500):
+    """Checks that objects referenced by protected many-to-one relations of
+    `objects` exist, are accessible and writable. Ids are collected per
+    related model from all objects and loaded with one access filtered IN
+    query per chunk, objects in the identity map are not queried.
+    Returns errors ({column: message}) per object."""
+    references, ids = _collect_references(objects)
+    found = {rel_class: _load_references(rel_class, rel_ids, chunk_size)
+             for rel_class, rel_ids in ids.items()}
+    return _reference_errors(references, found)
+
+
+def _collect_references(objects):
+    """(column, related model, id) per object and ids per related model"""
+    references, ids = [], {}
+    for obj in objects:
+        obj_references = []
+        for column, rel_class in obj._verified_references():
+            value = getattr(obj, column)
+            if not value:
+                continue
+            ids.setdefault(rel_class, set()).add(value)
+            obj_references.append((column, rel_class, value))
+        references.append(obj_references)
+    return references, ids
+
+
+def _reference_errors(references, found):
+    errors = []
+    for obj_references in references:
+        obj_errors = {}
+        for column, rel_class, value in obj_references:
+            target = found[rel_class].get(value)
+            if target is None:
+                obj_errors[column] = \
+                    f'{value} : object with such id not found'
+            elif not target.check_permission(Permission.WRITE,
+                                              abort_on_fail=False):
+                obj_errors[column] = f'{value} : permission denied'
+        errors.append(obj_errors)
+    return errors
+
+
+def _load_references(model, ids, chunk_size):
+    found, missing = {}, []
+    identity_map = db.session.identity_map
+    for obj_id in ids:
+        obj = identity_map.get(identity_key(model, obj_id))
+        if obj is None:
+            missing.append(obj_id)
+        elif not obj.deleted and obj.check_permission(Permission.READ,
+                                                      abort_on_fail=False):
+            found[obj_id] = obj
+    for start in range(0, len(missing), chunk_size):
+        query = model.query.with_access_check().filter(
+            model.id.in_(missing[start:start + chunk_size]))
+        found.update((obj.id, obj) for obj in query)
+    return found
+
+
 class UniqueNameEntity(BaseEntity):
     """Should only extends BaseEntity"""
-    __table_args__ = (UniqueConstraint('name', 'user_id',
-                                       name='_unique_name_user'),)
+    unique_fields = ('name',)
+
+    @classmethod
+    def table_indexes(cls):
+        return super(UniqueNameEntity, cls).table_indexes() + [
+            UniqueConstraint('name', 'user_id', name='_unique_name_user')]
 
     @declared_attr
     def name(cls):
@@ -289,6 +398,12 @@ class UniqueNameEntity(BaseEntity):
 
 class BaseMultiTenantEntity(BaseEntity):
 
+    @classmethod
+    def table_indexes(cls):
+        return super(BaseMultiTenantEntity, cls).table_indexes() + [
+            Index(f'ix_{cls.__tablename__}_tenant_id_deleted_id',
+                  'tenant_id', 'deleted', 'id')]
+
     @declared_attr
     def tenant_id(cls):
         return db.Column(Integer, ForeignKey('tenant.id'))
@@ -297,8 +412,8 @@ class BaseMultiTenantEntity(BaseEntity):
     def tenant(cls):
         return db.relationship('Tenant')
 
-    def populate_from_request(self):
-        super(BaseMultiTenantEntity, self).populate_from_request()
+    def populate_from_data(self, data, cleaned=False):
+        super(BaseMultiTenantEntity, self).populate_from_data(data, cleaned)
         self.user_id = g.user.id
         self.tenant_id = g.user.tenant_id
 
@@ -321,10 +436,25 @@ class BaseMultiTenantEntity(BaseEntity):
 
         return True
 
-    def is_unique(self, field, value):
-        _filter = {field: value, 'tenant_id': g.user.tenant_id}
-        return not bool(self.__class__.query.filter_by(
-            **_filter).count())
+    @classmethod
+    def permission_criteria(cls, action):
+        if not g.user:
+            return false()
+        if g.user.has_role(DefaultRoles.SUPER_ADMIN.name):
+            return None
+        if g.user.has_role(DefaultRoles.TENANT_ADMIN.name):
+            return None
+        if not (g.user.has_permission('ALL') or g.user.has_permission(
+                action, cls.__tablename__)):
+            return false()
+        hidden = [AccessType.PRIVATE]
+        if action != Permission.READ:
+            hidden.append(AccessType.PROTECTED)
+        return cls.access.notin_(hidden) | (cls.user_id == g.user.id)
+
+    @classmethod
+    def unique_scope(cls):
+        return g.user.tenant_id, cls.tenant_id == g.user.tenant_id
 
     @classmethod
     def access_filter(cls, query):
@@ -338,8 +468,12 @@ class BaseMultiTenantEntity(BaseEntity):
 
 class UniqueNameTenantEntity(BaseMultiTenantEntity):
     """Should only extends BaseMultiTenantEntity"""
-    __table_args__ = (UniqueConstraint('name', 'tenant_id',
-                                       name='_unique_name_tenant'),)
+    unique_fields = ('name',)
+
+    @classmethod
+    def table_indexes(cls):
+        return super(UniqueNameTenantEntity, cls).table_indexes() + [
+            UniqueConstraint('name', 'tenant_id', name='_unique_name_tenant')]
 
     @declared_attr
     def name(cls):
@@ -362,6 +496,43 @@ user_to_role = db.Table(
 )
 
 
+_PERMISSIONS_VERSION_KEY = 'user_permissions_version'
+
+
+class CompiledPermissions:
+    """Immutable roles/permissions lookup of a user"""
+    __slots__ = ('roles', 'permissions')
+
+    def __init__(self, roles, permissions):
+        self.roles = roles
+        self.permissions = permissions
+
+    @classmethod
+    def compile(cls, roles):
+        permissions = {}
+        for role in roles:
+            for p in role.permissions:
+                permissions.setdefault(p.model, set()).add(p.type)
+        return cls(frozenset(r.name for r in roles),
+                   {model: frozenset(types)
+                    for model, types in permissions.items()})
+
+    def has_permission(self, action, model=None):
+        return action in self.permissions.get(model, ())
+
+    def __getstate__(self):
+        return self.roles, self.permissions
+
+    def __setstate__(self, state):
+        self.roles, self.permissions = state
+
+
+def invalidate_all_permissions():
+    """Drop cached permissions of all users, e.g. when roles are edited"""
+    cache.set(_PERMISSIONS_VERSION_KEY,
+              (cache.get(_PERMISSIONS_VERSION_KEY) or 0) + 1)
+
+
 class UserBase(BaseModel):
     @declared_attr
     def roles(cls):
@@ -369,21 +540,41 @@ class UserBase(BaseModel):
 
     def has_role(self, role):
         name = role if isinstance(role, str) else role.name
-        return name in [r.name for r in self.roles]
+        return name in self.compiled_permissions.roles
 
     def has_permission(self, action, model=None):
-        return bool(action in self.permissions.get(model, []))
+        return self.compiled_permissions.has_permission(action, model)
 
     @property
     def permissions(self):
-        permissions = {}
-        for role in self.roles:
-            for p in role.permissions:
-                if not permissions.get(p.model):
-                    permissions[p.model] = set(p.type)
-                else:
-                    permissions[p.model].add(p.type)
-        return permissions
+        return self.compiled_permissions.permissions
+
+    @property
+    def compiled_permissions(self):
+        """Roles and permissions lookup, memoized on the instance and cached
+        across requests for persistent users"""
+        compiled = self.__dict__.get('_compiled_permissions')
+        if compiled is not None:
+            return compiled
+        key = None
+        if inspect(self).persistent:
+            key = self._permissions_cache_key()
+            compiled = cache.get(key)
+        if compiled is None:
+            compiled = CompiledPermissions.compile(self.roles)
+            if key:
+                cache.set(key, compiled)
+        self._compiled_permissions = compiled
+        return compiled
+
+    def _permissions_cache_key(self):
+        version = cache.get(_PERMISSIONS_VERSION_KEY) or 0
+        return f'user_permissions:{version}:{self.__tablename__}:{self.id}'
+
+    def invalidate_permissions(self):
+        self.__dict__.pop('_compiled_permissions', None)
+        if inspect(self).has_identity:
+            cache.delete(self._permissions_cache_key())
 
     def to_api(self, join_relations=True):
         data = super(UserBase, self).to_api(join_relations=join_relations)
@@ -406,6 +597,10 @@ class Role(BaseModel, db.Model):
     description = db.Column(db.Text())
     permissions = db.relationship('Permission')
 
+    @classmethod
+    def table_indexes(cls):
+        return []  # no id column
+
     def id(self):
         # for compatibility
         return self.name
@@ -467,3 +662,42 @@ class TenantBase(BaseModel):
     @declared_attr
     def users(cls):
         return db.relationship('User')
+
+
+@event.listens_for(db.session, 'after_flush')
+def _track_permission_changes(session, flush_context):
+    changes = session.info.setdefault('vanilla_permission_changes', set())
+    for obj in set(session.new) | set(session.dirty) | set(session.deleted):
+        if isinstance(obj, (Role, Permission)):
+            changes.add(None)  # all users
+        elif isinstance(obj, UserBase) and \
+                inspect(obj).attrs.roles.history.has_changes():
+            obj.__dict__.pop('_compiled_permissions', None)
+            changes.add(obj._permissions_cache_key())
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _track_executed_permission_changes(orm_execute_state):
+    if (orm_execute_state.is_insert or orm_execute_state.is_update or
+            orm_execute_state.is_delete) and \
+            orm_execute_state.statement.table.name in (
+                Role.__tablename__, Permission.__tablename__,
+                user_to_role.name):
+        orm_execute_state.session.info.setdefault(
+            'vanilla_permission_changes', set()).add(None)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_permissions(session):
+    # objects are expired here, so keys are collected on flush
+    changes = session.info.pop('vanilla_permission_changes', ())
+    for key in changes:
+        if key is None:
+            invalidate_all_permissions()
+        else:
+            cache.delete(key)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_permission_changes(session):
+    session.info.pop('vanilla_permission_changes', None)
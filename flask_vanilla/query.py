@@ -1,9 +1,12 @@
 from flask_sqlalchemy import BaseQuery
 from flask import request
-from flask import current_app
-from sqlalchemy.orm import joinedload
 
-db = current_app.db # noqa
+from . import db
+
+
+def _model(query):
+    return query.column_descriptions[0]['entity']
+
 
 class QueryWithSoftDelete(BaseQuery):
     def __new__(cls, *args, **kwargs):
@@ -18,7 +21,7 @@ class QueryWithSoftDelete(BaseQuery):
         pass
 
     def with_deleted(self):
-        return self.__class__(db.class_mapper(self._mapper_zero().class_),
+        return self.__class__(db.class_mapper(_model(self)),
                               session=db.session(), _with_deleted=True)
 
     def _get(self, *args, **kwargs):
@@ -45,29 +48,24 @@ class QueryWithSoftDeleteAndAccess(BaseQuery):
             obj = obj.filter_by(
                 deleted=False) if not obj._with_deleted else obj
             if request and obj._with_access_check:
-                for entity in obj._entities:
-                    obj = entity.mapper.class_.access_filter(obj)
-            if request and request.args.get('include'):
-                join_list = request.args.get('include').split(',')
-                options = []
-                for join_entry in join_list:
-                    options.append(joinedload(join_entry))
-                obj = obj.options(options)
+                for description in obj.column_descriptions:
+                    obj = description['entity'].access_filter(obj)
         return obj
 
     def __init__(self, *args, **kwargs):
         pass
 
     def with_deleted(self):
-        return self.__class__(db.class_mapper(self._mapper_zero().class_),
+        return self.__class__(db.class_mapper(_model(self)),
                               session=db.session(), _with_deleted=True)
 
-    def with_access_check(self):
-        return self.__class__(db.class_mapper(self._mapper_zero().class_),
-                              session=db.session(), _with_access_check=True)
+    def with_access_check(self, with_deleted=False):
+        return self.__class__(db.class_mapper(_model(self)),
+                              session=db.session(), _with_access_check=True,
+                              _with_deleted=with_deleted)
 
     def raw(self):
-        return self.__class__(db.class_mapper(self._mapper_zero().class_),
+        return self.__class__(db.class_mapper(_model(self)),
                               session=db.session(), _with_deleted=True,
                               _with_access_check=False)
 
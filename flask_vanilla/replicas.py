@@ -0,0 +1,206 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+
+from . import db, cache
+
+
+class ReplicaSelection:
+    ROUND_ROBIN = 'round-robin'
+    LEAST_BUSY = 'least-busy'  # fewest checked out connections
+    ALL = [ROUND_ROBIN, LEAST_BUSY]
+
+
+class ReplicaPool:
+    """Engines of SQLALCHEMY_REPLICA_URIS (`app.replica_pool`), created on
+    first use. Reads of ModelAPI views wrapped with `read_from_replica` are
+    executed by db.session on a replica chosen per request, unless the
+    request or the user wrote to the primary during the last
+    SQLALCHEMY_REPLICA_STICKY_SECONDS (read-your-writes).
+    A replica which fails to execute a read is skipped for
+    SQLALCHEMY_REPLICA_RETRY_SECONDS, the read is retried on the primary."""
+
+    def __init__(self, app):
+        self.app = app
+        self._engines = None
+        self._active = []
+        self._reads = []
+        self._down_until = []
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+
+    @property
+    def engines(self):
+        if self._engines is None:
+            uris = self.app.config['SQLALCHEMY_REPLICA_URIS']
+            with self._lock:
+                if self._engines is None:
+                    self._engines = [self._create_engine(index, uri)
+                                     for index, uri in enumerate(uris)]
+        return self._engines
+
+    def _create_engine(self, index, uri):
+        url = make_url(uri)
+        if url.get_backend_name() == 'sqlite' and url.database and \
+                url.database != ':memory:' and not os.path.isabs(url.database):
+            # relative to the app, as Flask-SQLAlchemy does for the primary
+            url = url.set(database=os.path.join(self.app.root_path,
+                                                url.database))
+        engine = create_engine(
+            url, **self.app.config['SQLALCHEMY_REPLICA_ENGINE_OPTIONS'])
+        self._active.append(0)
+        self._reads.append(0)
+        self._down_until.append(0)
+
+        @event.listens_for(engine, 'checkout')
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            with self._lock:
+                self._active[index] += 1
+
+        @event.listens_for(engine, 'checkin')
+        def checkin(dbapi_connection, connection_record):
+            with self._lock:
+                self._active[index] -= 1
+
+        return engine
+
+    def stats(self):
+        now = time.monotonic()
+        return [{'reads': reads, 'active': active, 'down': down_until > now}
+                for reads, active, down_until in
+                zip(self._reads, self._active, self._down_until)]
+
+    def choose(self, selection=None):
+        """Replica engine, None if there are no replicas or all are down"""
+        engines = self.engines
+        if not engines:
+            return None
+        selection = selection or \
+            self.app.config['SQLALCHEMY_REPLICA_SELECTION']
+        if selection not in ReplicaSelection.ALL:
+            raise ValueError(f'Unknown replica selection: {selection}')
+        counter = next(self._counter)
+        now = time.monotonic()
+        with self._lock:
+            available = [index for index, down_until in
+                         enumerate(self._down_until) if down_until <= now]
+            if not available:
+                return None
+            start = counter % len(available)
+            index = available[start]
+            if selection == ReplicaSelection.LEAST_BUSY:
+                # ties are resolved round-robin
+                order = available[start:] + available[:start]
+                index = min(order, key=self._active.__getitem__)
+            self._reads[index] += 1
+        return engines[index]
+
+    def engine_for_request(self, selection=None):
+        """Replica for reads of the request, None if they should go to the
+        primary"""
+        if stick_to_primary():
+            return None
+        return self.choose(selection)
+
+    def mark_down(self, engine):
+        """Skip the replica for SQLALCHEMY_REPLICA_RETRY_SECONDS"""
+        index = self.engines.index(engine)
+        retry = self.app.config['SQLALCHEMY_REPLICA_RETRY_SECONDS']
+        with self._lock:
+            self._down_until[index] = time.monotonic() + retry
+        self.app.logger.warning(f'Replica {engine.url!r} is down, reads go '
+                                f'to the primary for {retry}s')
+
+    def dispose(self):
+        """Close connections of the replicas, engines are created again
+        (from the current config) on next use"""
+        with self._lock:
+            engines, self._engines = self._engines, None
+            self._active, self._reads, self._down_until = [], [], []
+        for engine in engines or ():
+            engine.dispose()
+
+
+def read_from_replica(view, selection=None):
+    """Executes reads of the view on a replica of `app.replica_pool`"""
+    if asyncio.iscoroutinefunction(view):
+        return view  # AsyncModelAPI reads with the async engine
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        pool = current_app.replica_pool
+        engine = pool.engine_for_request(selection)
+        if engine is None:
+            return view(*args, **kwargs)
+        g._vanilla_replica = engine
+        try:
+            return view(*args, **kwargs)
+        except OperationalError:
+            # replica is not reachable (or lags behind the schema), the
+            # view only reads, so it can be executed again on the primary
+            pool.mark_down(engine)
+            db.session.rollback()
+        finally:
+            g.pop('_vanilla_replica', None)
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def stick_to_primary():
+    """Whether reads of the request go to the primary (read-your-writes):
+    the request or the user wrote to it during the last
+    SQLALCHEMY_REPLICA_STICKY_SECONDS"""
+    if not current_app.config['SQLALCHEMY_REPLICA_URIS']:
+        return False
+    return bool(g.get('_vanilla_wrote') or cache.get(_sticky_key()))
+
+
+def _sticky_key():
+    user = g.get('user')
+    client = getattr(user, 'id', None) or request.remote_addr
+    return f'replica_sticky:{client}'
+
+
+@event.listens_for(db.session, 'after_flush')
+def _track_write(session, flush_context):
+    session.info['vanilla_wrote'] = True
+    if has_request_context():
+        g._vanilla_wrote = True  # next reads of the request use the primary
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _track_execute(orm_execute_state):
+    # Core INSERTs of bulk create and user actions are not flushed
+    if orm_execute_state.is_insert or orm_execute_state.is_update or \
+            orm_execute_state.is_delete:
+        _track_write(orm_execute_state.session, None)
+
+
+@event.listens_for(db.session, 'after_bulk_update')
+@event.listens_for(db.session, 'after_bulk_delete')
+def _track_bulk_write(update_context):
+    _track_write(update_context.session, None)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _stick_to_primary(session):
+    if not session.info.pop('vanilla_wrote', False) or \
+            not has_request_context():
+        return
+    timeout = current_app.config['SQLALCHEMY_REPLICA_STICKY_SECONDS']
+    if current_app.config['SQLALCHEMY_REPLICA_URIS'] and timeout:
+        cache.set(_sticky_key(), True, timeout=timeout)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_write(session):
+    session.info.pop('vanilla_wrote', None)
@@ -0,0 +1,45 @@
+from datetime import datetime, date
+
+from sqlalchemy.orm import ColumnProperty
+
+
+class ModelSerializer:
+    """Converts model objects to API dicts.
+    Compiled once per mapped class (see `BaseModel.__declare_last__`),
+    keeps only public column attributes, dates are converted to ISO format.
+    Attributes which are not loaded (deferred) are skipped."""
+
+    def __init__(self, model_class):
+        mapper = model_class.__mapper__
+        self.pk_key = mapper.get_property_by_column(
+            mapper.primary_key[0]).key
+        fields = []
+        for prop in mapper.iterate_properties:
+            if not isinstance(prop, ColumnProperty):
+                continue
+            column = prop.columns[0]
+            if getattr(column, 'is_private', False):
+                continue
+            try:
+                python_type = column.type.python_type
+            except NotImplementedError:
+                python_type = object
+            is_date = issubclass(python_type, (date, datetime))
+            fields.append((prop.key, is_date))
+        self.fields = tuple(fields)
+        self.keys = tuple(key for key, _ in fields)
+
+    def serialize(self, obj):
+        state = obj._sa_instance_state
+        if state.expired_attributes:
+            getattr(obj, self.pk_key)  # reload expired attributes
+        values = obj.__dict__
+        data = {}
+        for key, is_date in self.fields:
+            if key not in values:
+                continue
+            value = values[key]
+            if is_date and value is not None:
+                value = value.isoformat()
+            data[key] = value
+        return data
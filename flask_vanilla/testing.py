@@ -1,13 +1,26 @@
 import json
 
+from .instrumentation import REPEATED_QUERY_LIMIT_ENVIRON
+
+
 class BaseCRUDTestCaseMixin:
     app = None
     model_api = None
 
+    # fail if a statement is executed so many times in one request (N+1)
+    max_query_repeats = 10
+
     @property
     def prefix(self):
         return self.model_api.full_prefix
 
+    def client(self):
+        client = self.app.test_client()
+        # only requests of the test are strict, app config is shared
+        client.environ_base[REPEATED_QUERY_LIMIT_ENVIRON] = \
+            self.max_query_repeats
+        return client
+
     def create_fixtures(self):
         pass
 
@@ -19,46 +32,46 @@ class BaseCRUDTestCaseMixin:
 
     def test_basic_crud(self):
         obj = self.get_create_obj_fixture()
-        resp = self.app.test_client().post(f'/{self.prefix}',
-                                         data=json.dumps(obj))
+        resp = self.client().post(f'/{self.prefix}',
+                                  data=json.dumps(obj))
 
         self.assertEqual(200, resp.status_code, 'create fail')
         created = json.loads(resp.data)
         for k, v in obj.items():
             self.assertEqual(v, created.get(k), 'created is not valid')
 
-        resp = self.app.test_client().get(f'/{self.prefix}/{created["id"]}')
+        resp = self.client().get(f'/{self.prefix}/{created["id"]}')
         self.assertEqual(200, resp.status_code, 'get by id fail')
         retrieved = json.loads(resp.data)
         self.assertDictEqual(created, retrieved, 'retrieved is not valid')
 
         update_obj = self.get_update_obj_fixture()
 
-        resp = self.app.test_client().put(f'/{self.prefix}/{created["id"]}',
-                                         data=json.dumps(update_obj))
+        resp = self.client().put(f'/{self.prefix}/{created["id"]}',
+                                 data=json.dumps(update_obj))
 
         self.assertEqual(200, resp.status_code, 'update fail')
         retrieved = json.loads(resp.data)
         for k, v in update_obj.items():
             self.assertEqual(v, retrieved.get(k), 'updated is not valid')
 
-        resp = self.app.test_client().delete(f'/{self.prefix}/{created["id"]}')
+        resp = self.client().delete(f'/{self.prefix}/{created["id"]}')
 
         self.assertEqual(200, resp.status_code, 'delete fail')
 
-        resp = self.app.test_client().get(f'/{self.prefix}/{created["id"]}')
+        resp = self.client().get(f'/{self.prefix}/{created["id"]}')
 
         self.assertEqual(404, resp.status_code, 'delete fail')
 
     def test_hard_delete(self):
         obj = self.get_create_obj_fixture()
-        resp = self.app.test_client().post(f'/{self.prefix}',
-                                         data=json.dumps(obj))
+        resp = self.client().post(f'/{self.prefix}',
+                                  data=json.dumps(obj))
 
         self.assertEqual(200, resp.status_code, 'create fail')
         created = json.loads(resp.data)
 
-        resp = self.app.test_client().delete(
+        resp = self.client().delete(
             f'/{self.prefix}/{created["id"]}/hard-delete')
 
         self.assertEqual(200, resp.status_code, 'hard delete fail')
@@ -75,8 +88,60 @@ class BaseCRUDTestCaseMixin:
             self.model_api.db.session.add(obj)
         self.model_api.db.session.commit()
 
-        resp = self.app.test_client().get(f'/{self.prefix}/')
+        resp = self.client().get(f'/{self.prefix}/')
 
         self.assertEqual(200, resp.status_code)
         result = json.loads(resp.data)
         self.assertEqual(10, len(result))
+
+    def test_bulk_create(self):
+        objs = [self.get_create_obj_fixture() for _ in range(3)]
+        resp = self.client().post(f'/{self.prefix}/bulk',
+                                  data=json.dumps(objs))
+
+        self.assertEqual(200, resp.status_code, 'bulk create fail')
+        results = json.loads(resp.data)
+        self.assertEqual(len(objs), len(results))
+        for obj, result in zip(objs, results):
+            self.assertIn('result', result, 'bulk create item fail')
+            for k, v in obj.items():
+                self.assertEqual(v, result['result'].get(k),
+                                 'created is not valid')
+
+    def test_bulk_update(self):
+        objs = [self.get_create_obj_fixture() for _ in range(3)]
+        resp = self.client().post(f'/{self.prefix}/bulk',
+                                  data=json.dumps(objs))
+        self.assertEqual(200, resp.status_code, 'bulk create fail')
+        ids = [r['result']['id'] for r in json.loads(resp.data)]
+
+        update_obj = self.get_update_obj_fixture()
+        resp = self.client().patch(
+            f'/{self.prefix}/bulk',
+            data=json.dumps([dict(update_obj, id=i) for i in ids]))
+
+        self.assertEqual(200, resp.status_code, 'bulk update fail')
+        results = json.loads(resp.data)
+        self.assertEqual(ids, [r['result']['id'] for r in results])
+        for result in results:
+            for k, v in update_obj.items():
+                self.assertEqual(v, result['result'].get(k),
+                                 'updated is not valid')
+
+    def test_delete_all(self):
+        objs = [self.get_create_obj_fixture() for _ in range(3)]
+        resp = self.client().post(f'/{self.prefix}/bulk',
+                                  data=json.dumps(objs))
+        self.assertEqual(200, resp.status_code, 'bulk create fail')
+        ids = [r['result']['id'] for r in json.loads(resp.data)]
+
+        resp = self.client().delete(
+            f'/{self.prefix}/delete-all',
+            data=json.dumps({'id_list': ids + [0]}),
+            content_type='application/json')
+
+        self.assertEqual(200, resp.status_code, 'delete all fail')
+        self.assertEqual(sorted(ids), sorted(json.loads(resp.data)))
+        for obj_id in ids:
+            resp = self.client().get(f'/{self.prefix}/{obj_id}')
+            self.assertEqual(404, resp.status_code, 'delete all fail')
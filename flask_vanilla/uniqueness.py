@@ -0,0 +1,82 @@
+import hashlib
+import math
+
+from . import cache
+from .caching import table_version
+
+
+class BloomFilter:
+    """Set of values without false negatives: `value in bloom` is False
+    only if the value was never added"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) /
+                               math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(str(value).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(value))
+
+
+class UniqueNegativeCache:
+    """Short-circuits is-unique checks of ModelAPI: a bloom filter of used
+    values is built per field and unique scope (user or tenant) with one
+    query, a value missing in the filter is free without a DB query, others
+    are checked in DB. Cached until the table is written, scopes with more
+    than `max_values` values are not cached."""
+
+    def __init__(self, model, timeout=None, max_values=100000,
+                 error_rate=0.01):
+        self.model = model
+        self.timeout = timeout
+        self.max_values = max_values
+        self.error_rate = error_rate
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def is_free(self, field, value):
+        """True if the value is surely not used, False if it may be"""
+        bloom = self._filter(field)
+        if bloom is not None and value not in bloom:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def _filter(self, field):
+        scope, _ = self.model.unique_scope()
+        table = self.model.__table__.name
+        key = f'unique:{table}:{field}:{scope}:{table_version(table)}'
+        bloom = cache.get(key)
+        if bloom is None:
+            bloom = self._build(field)
+            cache.set(key, bloom, timeout=self.timeout)
+        return bloom or None
+
+    def _build(self, field):
+        column = getattr(self.model, field)
+        values = self.model.unique_scope_query().with_entities(
+            column).filter(column.isnot(None)).limit(self.max_values + 1)
+        values = [value for value, in values]
+        if len(values) > self.max_values:
+            return False  # cached too, so the scope is not queried again
+        bloom = BloomFilter(len(values), self.error_rate)
+        for value in values:
+            bloom.add(value)
+        return bloom
@@ -1,41 +1,188 @@
-from flask_validator import Validator
-from datetime import datetime
+from datetime import datetime, date
+
+from sqlalchemy import event
+
+
 class ModelValidationError(Exception):
     def __init__(self, errors):
         self.errors = errors
         self.msg = 'Validation has been failed'
 
-class MutableValidator(Validator):
+
+def _not_valid(value, key):
+    return ValueError(f'Value {value} from column {key} is not valid')
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
+
+def _parse_datetime(value):
+    if isinstance(value, str):
+        # fast path for `2020-01-31T10:00:00.000Z`, strptime is slow
+        try:
+            return datetime.fromisoformat(value[:-1] if value.endswith('Z')
+                                          else value)
+        except ValueError:
+            return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%fZ')
+    return value
+
+
+_CHECKS = {
+    str: lambda value: isinstance(value, str),
+    int: lambda value: isinstance(value, int),
+    float: lambda value: isinstance(value, (int, float)),
+    date: lambda value: isinstance(value, date),
+    datetime: lambda value: isinstance(value, datetime),
+}
+
+_PARSERS = {date: _parse_date, datetime: _parse_datetime}
+
+
+def _compile_rule(column, custom):
+    key = column.name
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        python_type = object
+    nullable = column.nullable
+    parse = _PARSERS.get(python_type)
+    check = _CHECKS.get(python_type)
+    max_length = getattr(column.type, 'length', None) \
+        if python_type == str else None
+
+    def rule(value):
+        if value is None:
+            if not nullable:
+                raise _not_valid(value, key)
+            return value
+        if parse is not None:
+            try:
+                value = parse(value)
+            except (ValueError, TypeError):
+                raise _not_valid(value, key)
+        if check is not None and not check(value):
+            raise _not_valid(value, key)
+        if max_length and len(value) > max_length:
+            raise ValueError(f'Max length is {max_length}')
+        for validator in custom:
+            value = validator(value)
+        return value
+
+    return rule
+
+
+class CompiledValidator:
+    """Checks and coerces incoming data of a model in one pass, before any
+    ORM attribute event: types, lengths, nullability, dates and validators
+    returned by `Model.validators()`. Compiled once per mapped class (see
+    `BaseModel.__declare_last__`).
+    Protected, private and unknown keys are skipped, as well as not mutable
+    columns of saved objects."""
+
+    def __init__(self, model_class):
+        custom = model_class.validators() or {}
+        self.rules = {}
+        self.mutable = set()
+        self.required = []
+        for column in model_class.__table__.columns:
+            if getattr(column, 'is_private', False):
+                continue
+            if not column.nullable and not column.default and \
+                    not column.server_default and not column.autoincrement:
+                self.required.append(column.name)
+            # id is never populated from data
+            if getattr(column, 'is_protected', False) or column.name == 'id':
+                continue
+            validators = custom.get(column.name, ())
+            if callable(validators):
+                validators = (validators,)
+            self.rules[column.name] = _compile_rule(column, tuple(validators))
+            if getattr(column, 'is_mutable', True):
+                self.mutable.add(column.name)
+
+    def clean(self, data, saved=False):
+        """Validated and coerced copy of `data`, raises ModelValidationError
+        with errors of all fields"""
+        cleaned, errors = {}, {}
+        for key, value in data.items():
+            rule = self.rules.get(key)
+            if rule is None or (saved and key not in self.mutable):
+                continue
+            try:
+                cleaned[key] = rule(value)
+            except ValueError as e:
+                errors[key] = str(e)
+        if errors:
+            raise ModelValidationError(errors)
+        return cleaned
+
+    def clean_many(self, items, saved=False):
+        """Validates a bulk payload, returns list of (index, cleaned data)
+        and errors by index"""
+        cleaned, errors = [], {}
+        for index, data in enumerate(items):
+            if not isinstance(data, dict):
+                errors[index] = {'': 'Object expected'}
+                continue
+            try:
+                cleaned.append((index, self.clean(data, saved)))
+            except ModelValidationError as e:
+                errors[index] = e.errors
+        return cleaned, errors
+
+
+class MutableValidator:
+    """Attribute set-event validator with the interface of flask_validator's
+    `Validator` (which is no longer a dependency), kept for models declaring
+    own validators: `transform` coerces the value, `check_value` accepts it.
+    Validators returned by `Model.validators()` are cheaper, they run once
+    per field in `CompiledValidator`."""
+
+    def __init__(self, field, allow_null=True, throw_exception=False,
+                 message=None):
+        self.field = field
+        self.allow_null = allow_null
+        self.throw_exception = throw_exception
+        self.message = message
+        event.listen(field, 'set', self._validate, retval=True)
+
     def transform(self, value):
         return value
 
-    # hook over method protection
-    def _FlaskValidator__validate(self, target, value, oldvalue, initiator):
+    def check_value(self, value):
+        return True
+
+    def _validate(self, target, value, oldvalue, initiator):
         try:
             value = self.transform(value)
         except Exception:
             pass
-        return super(MutableValidator, self)._FlaskValidator__validate(
-            target, value, oldvalue, initiator)
+        if (value is None and self.allow_null) or \
+                (value is not None and self.check_value(value)):
+            return value
+        if self.throw_exception:
+            if self.message:
+                raise ValueError(self.message)
+            raise _not_valid(value, self.field.key)
+        return oldvalue
+
 
 class ValidateDate(MutableValidator):
     def transform(self, value):
-        if isinstance(value, str):
-            return datetime.strptime(value, "%Y-%m-%d")
-        else:
-            return value
+        return _parse_date(value)
 
     def check_value(self, value):
-        # return isinstance(value, date)
-        return True
+        return isinstance(value, date)
 
 
 class ValidateDateTime(MutableValidator):
     def transform(self, value):
-        if isinstance(value, str):
-            return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ")
-        else:
-            return value
+        return _parse_datetime(value)
 
     def check_value(self, value):
-        return isinstance(value, datetime)
\ No newline at end of file
+        return isinstance(value, datetime)